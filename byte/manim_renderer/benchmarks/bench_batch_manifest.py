@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Memory benchmark: scheduling jobs from batch manifests of growing size
+
+Compares loading the whole manifest before the first job starts (the batch
+runner's old behaviour) with streaming it one job at a time, the way
+run_batch schedules. Reports the peak Python memory and the time until the
+first job could be started.
+
+Usage (from manim_renderer/):
+    python benchmarks/bench_batch_manifest.py [--sizes 1000 10000 100000]
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from manim_generator import count_batch_jobs, iter_batch_manifest  # noqa: E402
+
+
+def write_manifest(path: Path, jobs: int):
+    """A manifest of `jobs` jobs with realistic path lengths"""
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(jobs):
+            f.write(json.dumps({
+                'json': f"scripts/backfill/{i:06d}/script.json",
+                'output': f"videos/backfill/{i:06d}/video.mp4",
+                'audio': f"audio/backfill/{i:06d}/narration.mp3",
+            }) + "\n")
+
+
+def load_all(manifest: Path) -> float:
+    """Parse every job up front, then schedule them; returns seconds to the first job"""
+    start = time.perf_counter()
+    jobs = list(iter_batch_manifest(manifest))
+    first = time.perf_counter() - start
+    for _ in jobs:
+        pass
+    return first
+
+
+def stream(manifest: Path) -> float:
+    """Count the jobs, then parse each as it is scheduled; returns seconds to the first job"""
+    start = time.perf_counter()
+    count_batch_jobs(manifest)
+    jobs = iter_batch_manifest(manifest)
+    next(jobs)
+    first = time.perf_counter() - start
+    for _ in jobs:
+        pass
+    return first
+
+
+def measure(method, manifest: Path):
+    """(peak MB, seconds to first job) for one pass over the manifest"""
+    tracemalloc.start()
+    first = method(manifest)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1e6, first
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help='Jobs per manifest')
+    args = parser.parse_args()
+
+    methods = {'load all': load_all, 'stream': stream}
+    print(f"  {'jobs':>7} " + " ".join(f"{name + ' peak':>15} {'first job':>10}" for name in methods))
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for size in args.sizes:
+            manifest = Path(temp_dir) / f"manifest-{size}.jsonl"
+            write_manifest(manifest, size)
+            results = [measure(method, manifest) for method in methods.values()]
+            print(f"  {size:>7} " + " ".join(f"{peak:12.2f} MB {first * 1000:7.1f} ms" for peak, first in results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: clean_latex vs the previous chained str.replace version
+
+Usage (from manim_renderer/):
+    python benchmarks/bench_clean_latex.py [--count 5000]
+"""
+
+import argparse
+import json
+import re
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from manim_generator import clean_latex  # noqa: E402
+
+
+def legacy_clean_latex(latex_str: str) -> str:
+    """clean_latex as it was before the regex normalizer"""
+    latex_str = latex_str.replace('$$', '')
+    latex_str = latex_str.replace('$', '')
+    latex_str = latex_str.replace('\\\\', '\\')
+    latex_str = latex_str.replace('\\text{', '\\mathrm{')
+    latex_str = latex_str.replace('\\pm', '\\pm ')
+    latex_str = latex_str.replace('\\sin', '\\sin ')
+    latex_str = latex_str.replace('\\cos', '\\cos ')
+    latex_str = latex_str.replace('\\tan', '\\tan ')
+    latex_str = latex_str.replace('\\log', '\\log ')
+    latex_str = latex_str.replace('\\ln', '\\ln ')
+    latex_str = latex_str.replace('infinity', '\\infty')
+    latex_str = latex_str.replace('∞', '\\infty')
+    latex_str = latex_str.replace('±', '\\pm')
+    latex_str = latex_str.replace('≤', '\\leq')
+    latex_str = latex_str.replace('≥', '\\geq')
+    latex_str = latex_str.replace('≠', '\\neq')
+    latex_str = latex_str.replace('→', '\\to')
+    latex_str = latex_str.replace('∈', '\\in')
+    latex_str = latex_str.replace('∀', '\\forall')
+    latex_str = latex_str.replace('∃', '\\exists')
+    import re
+    latex_str = re.sub(r'\s+', ' ', latex_str).strip()
+    return latex_str
+
+
+def sample_equations() -> list:
+    """Equations from the bundled test scripts plus a few synthetic ones"""
+    equations = [
+        "$$x = \\frac{-b \\pm \\sqrt{b^2 - 4ac}}{2a}$$",
+        "\\sin^2 x + \\cos^2 x = 1",
+        "\\lim_{x \\to infinity} \\frac{\\ln x}{x} = 0",
+        "f(x) ≤ g(x) \\text{ for all } x ∈ \\mathbb{R}",
+        "\\int_0^∞ e^{-x}\\,dx = 1",
+        "a \\\\ b \\\\ c",
+    ]
+    base = Path(__file__).resolve().parent.parent
+    for name in ("test_script.json", "new_structure_test.json", "latex_test.json"):
+        path = base / name
+        if not path.exists():
+            continue
+        text = path.read_text(encoding='utf-8')
+        equations.extend(json.loads(f'"{m}"') for m in re.findall(r'"(?:math|content)":\s*"((?:[^"\\]|\\.)*)"', text))
+    return equations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--count', type=int, default=5000, help='Distinct equations per run')
+    args = parser.parse_args()
+    
+    samples = sample_equations()
+    # Make every string distinct so the memoized path is measured separately
+    corpus = [f"{samples[i % len(samples)]} + {i}" for i in range(args.count)]
+    uncached = clean_latex.__wrapped__
+    
+    differing = [eq for eq in samples if legacy_clean_latex(eq) != clean_latex(eq)]
+    
+    runs = 5
+    timings = {
+        'legacy chained replace': min(timeit.repeat(lambda: [legacy_clean_latex(s) for s in corpus], number=1, repeat=runs)),
+        'current (uncached)': min(timeit.repeat(lambda: [uncached(s) for s in corpus], number=1, repeat=runs)),
+    }
+    clean_latex.cache_clear()
+    [clean_latex(s) for s in corpus]
+    timings['current (memoized)'] = min(timeit.repeat(lambda: [clean_latex(s) for s in corpus], number=1, repeat=runs))
+    
+    print(f"{len(corpus)} equations, best of {runs} runs")
+    for name, seconds in timings.items():
+        print(f"  {name:<24} {seconds * 1e6 / len(corpus):8.2f} us/equation")
+    print(f"Outputs differing from legacy on bundled samples: {len(differing)}")
+    for eq in differing:
+        print(f"  {eq!r}: {legacy_clean_latex(eq)!r} -> {clean_latex(eq)!r}")
+
+
+if __name__ == "__main__":
+    main()
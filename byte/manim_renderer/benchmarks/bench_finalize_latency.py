@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Latency benchmark: handing a finished render to the audio mux
+
+Times the step between Manim exiting and the final video being muxed, with
+the fixed waits the pipeline used to make (2s after the render, 1s before
+FFmpeg) and with the file release check that replaced them, which returns
+at once outside Windows. The render is stood in for by a short test video
+generated with FFmpeg, so only FFmpeg needs to be installed.
+
+Usage (from manim_renderer/):
+    python benchmarks/bench_finalize_latency.py [--seconds 10] [--repeat 3]
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from manim_generator import combine_audio_video, wait_for_file_release  # noqa: E402
+
+LEGACY_WAITS = (2.0, 1.0)  # After the render, then before FFmpeg
+
+
+def make_inputs(work_dir: Path, seconds: float):
+    """A silent 480p15 test video and a tone of the same length"""
+    video = work_dir / "render.mp4"
+    audio = work_dir / "narration.wav"
+    for cmd in (
+        ["ffmpeg", "-f", "lavfi", "-i", f"testsrc=size=854x480:rate=15:duration={seconds}",
+         "-pix_fmt", "yuv420p", "-y", str(video)],
+        ["ffmpeg", "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}", "-y", str(audio)],
+    ):
+        subprocess.run(cmd, capture_output=True, check=True)
+    return video, audio
+
+
+def fixed_waits(video: Path, audio: Path, output: Path) -> bool:
+    """The old handoff: sleep, then mux"""
+    for wait in LEGACY_WAITS:
+        time.sleep(wait)
+    return combine_audio_video(str(video), str(audio), str(output))
+
+
+def release_check(video: Path, audio: Path, output: Path) -> bool:
+    """The current handoff: wait only while the file is still in use, then mux"""
+    wait_for_file_release(video)
+    return combine_audio_video(str(video), str(audio), str(output))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--seconds', type=float, default=10.0, help='Length of the test video')
+    parser.add_argument('--repeat', type=int, default=3, help='Measurements per handoff, median is reported')
+    args = parser.parse_args()
+
+    methods = {'fixed waits': fixed_waits, 'release check': release_check}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        work_dir = Path(temp_dir)
+        video, audio = make_inputs(work_dir, args.seconds)
+        output = work_dir / "final.mp4"
+
+        medians = {}
+        for name, handoff in methods.items():
+            times = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                if not handoff(video, audio, output):
+                    sys.exit(f"{name}: mux failed")
+                times.append(time.perf_counter() - start)
+            medians[name] = statistics.median(times)
+
+    print(f"Render to muxed video, {args.seconds:.0f}s test video, median of {args.repeat}")
+    for name, seconds in medians.items():
+        print(f"  {name:<14} {seconds * 1000:8.0f} ms")
+    print(f"  saved per video {(medians['fixed waits'] - medians['release check']) * 1000:6.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark: writing RGBA frames into a pipe, per frame size
+
+Compares Manim's default handoff (snapshot the pixel array with np.array,
+then frame.tobytes()) with the direct handoff the scene's renderer uses
+(a memoryview of the live pixel array). The pipe is drained by a child
+process that reads into a reused buffer, standing in for FFmpeg's stdin.
+
+Usage (from manim_renderer/):
+    python benchmarks/bench_frame_pipe.py [--frames 120] [--sizes 480p 1080p]
+"""
+
+import argparse
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+FRAME_SIZES = {
+    '480p': (854, 480),
+    '720p': (1280, 720),
+    '1080p': (1920, 1080),
+    '1440p': (2560, 1440),
+    '2160p': (3840, 2160),
+}
+
+# Drains stdin as fast as the pipe delivers, without allocating per read
+SINK = (
+    "import sys\n"
+    "buffer = memoryview(bytearray(1 << 20))\n"
+    "while sys.stdin.buffer.raw.readinto(buffer):\n"
+    "    pass\n"
+)
+
+
+def snapshot_tobytes(stdin, pixels):
+    """Manim's CairoRenderer.get_frame() followed by SceneFileWriter.write_frame()"""
+    frame = np.array(pixels)
+    stdin.write(frame.tobytes())
+
+
+def direct_memoryview(stdin, pixels):
+    """DirectFrameRenderer handing its pixel array to PipeFrameFileWriter"""
+    stdin.write(memoryview(pixels).cast("B"))
+
+
+def measure(write_frame, pixels, frames: int) -> float:
+    """MB/s for `frames` writes of `pixels` through a fresh pipe"""
+    sink = subprocess.Popen([sys.executable, "-c", SINK], stdin=subprocess.PIPE)
+    start = time.perf_counter()
+    for i in range(frames):
+        pixels[0, 0, 0] = i & 0xFF  # Touch the frame the way drawing would
+        write_frame(sink.stdin, pixels)
+    sink.stdin.close()
+    sink.wait()
+    elapsed = time.perf_counter() - start
+    return pixels.nbytes * frames / elapsed / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--frames', type=int, default=120, help='Frames written per measurement')
+    parser.add_argument('--sizes', nargs='+', choices=list(FRAME_SIZES), default=list(FRAME_SIZES))
+    parser.add_argument('--repeat', type=int, default=3, help='Measurements per case, best is reported')
+    args = parser.parse_args()
+
+    methods = {'snapshot + tobytes': snapshot_tobytes, 'memoryview': direct_memoryview}
+    print(f"{args.frames} RGBA frames per run, best of {args.repeat}")
+    print(f"  {'size':<7} {'frame MB':>9} " + " ".join(f"{name:>20}" for name in methods) + f" {'speedup':>8}")
+    for size in args.sizes:
+        width, height = FRAME_SIZES[size]
+        pixels = np.random.default_rng(0).integers(0, 256, (height, width, 4), dtype=np.uint8)
+        rates = [max(measure(method, pixels, args.frames) for _ in range(args.repeat)) for method in methods.values()]
+        print(f"  {size:<7} {pixels.nbytes / 1e6:9.2f} "
+              + " ".join(f"{rate:15.0f} MB/s" for rate in rates)
+              + f" {rates[1] / rates[0]:7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
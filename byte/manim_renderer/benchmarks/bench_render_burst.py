@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Burst simulation: host render slots under many simultaneous renders
+
+Starts a burst of processes that each take a render slot and hold it for a
+short fake render, then reports peak concurrency, queue waits and how many
+were rejected as busy. Runs against a throwaway cache directory, so it never
+touches the slots of real renders.
+
+Usage (from manim_renderer/):
+    python benchmarks/bench_render_burst.py [--burst 24] [--max-renders 3] [--max-queue 8]
+"""
+
+import argparse
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from manim_generator import CACHE_DIR_ENV, RenderBusy, RenderLimits, render_slot  # noqa: E402
+
+
+def fake_render(limits, hold, running, peak, lock, results):
+    """Take a slot, hold it for `hold` seconds and report the queue wait"""
+    start = time.monotonic()
+    try:
+        with render_slot(limits):
+            waited = time.monotonic() - start
+            with lock:
+                running.value += 1
+                peak.value = max(peak.value, running.value)
+            time.sleep(hold)
+            with lock:
+                running.value -= 1
+        results.put(('ok', waited))
+    except RenderBusy:
+        results.put(('busy', time.monotonic() - start))
+
+
+def run_burst(args, limits):
+    """One burst of args.burst renders started together; returns (peak, outcomes)"""
+    running = multiprocessing.Value('i', 0)
+    peak = multiprocessing.Value('i', 0)
+    lock = multiprocessing.Lock()
+    results = multiprocessing.Queue()
+
+    processes = [
+        multiprocessing.Process(target=fake_render, args=(limits, args.hold, running, peak, lock, results))
+        for _ in range(args.burst)
+    ]
+    for process in processes:
+        process.start()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return peak.value, outcomes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--burst', type=int, default=24, help='Renders started at once')
+    parser.add_argument('--hold', type=float, default=0.5, help='Seconds each fake render holds its slot')
+    parser.add_argument('--max-renders', type=int, default=3)
+    parser.add_argument('--max-queue', type=int, default=8)
+    parser.add_argument('--queue-timeout', type=float, default=30.0)
+    args = parser.parse_args()
+
+    os.environ[CACHE_DIR_ENV] = tempfile.mkdtemp(prefix="render-burst-")
+    limits = RenderLimits(args.max_renders, args.max_queue, args.queue_timeout, memory_mb=0)
+
+    started = time.monotonic()
+    peak, outcomes = run_burst(args, limits)
+    elapsed = time.monotonic() - started
+
+    waits = sorted(wait for status, wait in outcomes if status == 'ok')
+    rejections = [wait for status, wait in outcomes if status == 'busy']
+
+    print(f"Burst of {args.burst} renders, {args.max_renders} slots, queue of {args.max_queue}, "
+          f"{args.hold:.2f}s per render")
+    print(f"  peak concurrency   {peak} (limit {args.max_renders})")
+    print(f"  completed          {len(waits)} in {elapsed:.2f}s")
+    if waits:
+        print(f"  queue wait         median {statistics.median(waits):.2f}s, max {waits[-1]:.2f}s")
+    print(f"  rejected as busy   {len(rejections)}"
+          + (f", slowest rejection {max(rejections) * 1000:.0f} ms" if rejections else ""))
+
+    if peak > args.max_renders:
+        print("FAIL: more renders ran at once than the limit allows")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
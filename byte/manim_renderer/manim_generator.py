@@ -9,941 +9,3119 @@ import sys
 import os
 import subprocess
 import tempfile
+import hashlib
+import re
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field, replace
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, List, Any
+from typing import TYPE_CHECKING, Dict, Iterator, List, Any, Callable, Optional, Tuple
 import argparse
 
+if TYPE_CHECKING:
+    import numpy as np
+
 # Ensure MiKTeX is in PATH
 miktex_path = os.path.expanduser(r"~\AppData\Local\Programs\MiKTeX\miktex\bin\x64")
 if os.path.exists(miktex_path) and miktex_path not in os.environ['PATH']:
     os.environ['PATH'] += os.pathsep + miktex_path
 
-# Manim imports
-from manim import *
-
-# Configure Manim for better LaTeX handling
-config.tex_template = TexTemplate()
-config.tex_template.add_to_preamble(r"\usepackage{amsmath}")
-config.tex_template.add_to_preamble(r"\usepackage{amssymb}")
-config.tex_template.add_to_preamble(r"\usepackage{amsfonts}")
-
-class MathVideoScene(Scene):
-    def __init__(self, script_data: Dict[str, Any], **kwargs):
-        super().__init__(**kwargs)
-        self.script_data = script_data
-        self.title = script_data.get('title', 'MathVideo')
-        
-        # Handle both old and new JSON structures
-        if 'sections' in script_data:
-            # New structure
-            self.total_duration = script_data.get('totalDuration', 300)
-            self.introduction = script_data.get('introduction', {})
-            self.sections = script_data.get('sections', [])
-            self.conclusion = script_data.get('conclusion', {})
-            self.use_new_structure = True
+# Manim is only imported on the code paths that draw (the scene module and the
+# build functions below), so the CLI, validation and cost estimation start fast.
+
+
+# Packages added to Manim's default TexTemplate (which loads babel, amsmath and
+# amssymb itself). The LaTeX preflight warns about commands outside LaTeX's
+# core and these packages, so add a package here before using its commands.
+LATEX_PACKAGES = ("amsmath", "amssymb", "amsfonts")
+
+
+@lru_cache(maxsize=None)
+def configure_manim():
+    """Import Manim and configure it for better LaTeX handling (once per process)"""
+    from manim import config, TexTemplate
+    
+    config.tex_template = TexTemplate()
+    for package in LATEX_PACKAGES:
+        config.tex_template.add_to_preamble(f"\\usepackage{{{package}}}")
+
+# Unicode symbols the script generator emits, mapped to LaTeX commands. The
+# trailing space keeps a following letter from merging into the command name.
+LATEX_SYMBOLS = str.maketrans({
+    '∞': '\\infty ',
+    '±': '\\pm ',
+    '≤': '\\leq ',
+    '≥': '\\geq ',
+    '≠': '\\neq ',
+    '→': '\\to ',
+    '∈': '\\in ',
+    '∀': '\\forall ',
+    '∃': '\\exists ',
+})
+
+# Operators that need a trailing space, matched as whole command names
+LATEX_SPACED_OPERATORS = re.compile(r'(\\(?:pm|ln|sin|cos|tan|log))(?![A-Za-z])\s*')
+
+
+def space_operator(match: "re.Match[str]") -> str:
+    """Replacement for one LATEX_SPACED_OPERATORS match"""
+    return match.group(1) + ' '
+
+
+@lru_cache(maxsize=8192)
+def clean_latex(latex_str: str) -> str:
+    """
+    Clean LaTeX string for Manim compatibility
+    
+    Unicode symbols go through a translation table (skipped for ASCII input)
+    and the fixed rewrites ($ delimiters, double backslashes, \\text{,
+    infinity) are plain str.replace calls. A regex pass spaces the operators,
+    matched only as whole command names so \\sinh or \\pmod are left alone,
+    and split/join collapses the whitespace. Results are memoized by input
+    string.
+    """
+    if not latex_str.isascii():
+        latex_str = latex_str.translate(LATEX_SYMBOLS)
+    latex_str = latex_str.replace('$', '').replace('\\\\', '\\')
+    latex_str = latex_str.replace('\\text{', '\\mathrm{').replace('infinity', '\\infty')
+    return ' '.join(LATEX_SPACED_OPERATORS.sub(space_operator, latex_str).split())
+
+
+# ---------------------------------------------------------------------------
+# LaTeX preflight
+# ---------------------------------------------------------------------------
+
+# Math-mode commands per package. Commands outside LaTeX's core and
+# LATEX_PACKAGES are reported as warnings (likely a typo, or a package the
+# template does not load, like physics or xcolor) but still go to latex, since
+# the list cannot be complete.
+LATEX_PACKAGE_COMMANDS = {
+    'latex': '''
+        alpha beta gamma delta epsilon varepsilon zeta eta theta vartheta iota kappa
+        lambda mu nu xi pi varpi rho varrho sigma varsigma tau upsilon phi varphi chi
+        psi omega Gamma Delta Theta Lambda Xi Pi Sigma Upsilon Phi Psi Omega
+        frac over atop choose brace brack above sqrt root of not
+        mathop mathbin mathrel mathord mathopen mathclose mathpunct mathinner
+        displaylimits hbox mbox vcenter kern mkern mskip hskip raise lower
+        S P dag ddag copyright pounds dots
+        cdot cdotp ldotp times div pm mp ast star circ bullet oplus ominus otimes
+        oslash odot bigcirc dagger ddagger amalg wr diamond cap cup uplus sqcap sqcup
+        vee wedge land lor setminus triangleleft triangleright bigtriangleup
+        bigtriangledown bigoplus bigotimes bigodot biguplus bigsqcup bigvee bigwedge
+        leq geq neq le ge ne ll gg approx equiv sim simeq cong asymp doteq propto
+        prec succ preceq succeq subset subseteq supset supseteq sqsubseteq sqsupseteq
+        in notin ni owns models vdash dashv mid parallel perp smile frown bowtie
+        infty partial nabla prime ell hbar imath jmath wp Re Im aleph emptyset angle
+        triangle top bot flat natural sharp surd backslash forall exists neg lnot
+        clubsuit diamondsuit heartsuit spadesuit
+        sum prod coprod int oint bigcup bigcap limits nolimits
+        lim limsup liminf sup inf max min arg det exp log ln lg deg dim gcd hom ker Pr
+        sin cos tan cot sec csc arcsin arccos arctan sinh cosh tanh coth
+        bmod pmod
+        to gets rightarrow leftarrow Rightarrow Leftarrow leftrightarrow Leftrightarrow
+        longrightarrow longleftarrow Longrightarrow Longleftarrow longleftrightarrow
+        Longleftrightarrow mapsto longmapsto hookrightarrow hookleftarrow
+        uparrow downarrow updownarrow Uparrow Downarrow Updownarrow
+        nearrow searrow swarrow nwarrow leftharpoonup rightharpoonup rightleftharpoons
+        mathrm mathbf mathit mathsf mathtt mathcal mathnormal
+        textbf textit textrm textsf texttt textnormal rm bf it cal sf tt
+        left right middle big Big bigg Bigg bigl bigr Bigl Bigr biggl biggr Biggl Biggr
+        bigm Bigm langle rangle lfloor rfloor lceil rceil lbrace rbrace lbrack rbrack
+        vert Vert
+        quad qquad hspace vspace phantom hphantom vphantom smash mathstrut enspace
+        displaystyle textstyle scriptstyle scriptscriptstyle
+        hat check breve acute grave tilde bar vec dot ddot mathring widehat widetilde
+        overline underline overbrace underbrace overrightarrow overleftarrow stackrel
+        colon cdots ldots vdots ddots hline cline
+        begin end
+    ''',
+    'amsmath': '''
+        dfrac tfrac cfrac genfrac binom dbinom tbinom
+        iint iiint iiiint idotsint
+        dots dotsc dotsb dotsm dotsi dddot ddddot
+        overleftrightarrow underrightarrow underleftarrow underleftrightarrow
+        xrightarrow xleftarrow implies impliedby iff
+        lvert rvert lVert rVert
+        text operatorname boldsymbol pmb
+        thinspace medspace thickspace negthinspace negmedspace negthickspace
+        overset underset substack boxed
+        mod pod injlim projlim varinjlim varprojlim varliminf varlimsup
+        tag notag nonumber intertext
+    ''',
+    'amssymb': '''
+        varkappa digamma backepsilon
+        leqslant geqslant leqq geqq lesssim gtrsim lessgtr gtrless
+        subsetneq supsetneq nsubseteq nsupseteq ncong nsim nmid nparallel
+        nleq ngeq nless ngtr nleqslant ngeqslant nleqq ngeqq
+        lneq gneq lneqq gneqq lnsim gnsim lnapprox gnapprox lvertneqq gvertneqq
+        nprec nsucc npreceq nsucceq precneqq succneqq precnsim succnsim
+        subsetneqq supsetneqq varsubsetneq varsupsetneq varsubsetneqq varsupsetneqq
+        nsubseteqq nsupseteqq nvdash nvDash nVdash nVDash
+        ntriangleleft ntriangleright ntrianglelefteq ntrianglerighteq
+        lessapprox gtrapprox lesseqgtr gtreqless approxeq thicksim thickapprox
+        eqsim varpropto between pitchfork backsim backsimeq doteqdot risingdotseq
+        fallingdotseq vartriangleleft vartriangleright trianglelefteq trianglerighteq
+        Subset Supset Cap Cup smallsetminus dotplus divideontimes intercal
+        leftleftarrows rightrightarrows Lsh Rsh curvearrowleft curvearrowright
+        circlearrowleft circlearrowright leadsto multimap
+        nleftarrow nrightarrow nLeftarrow nRightarrow nleftrightarrow nLeftrightarrow
+        vartriangle blacktriangle blacktriangledown triangledown lozenge blacklozenge
+        bigstar diagdown diagup Bbbk eth
+        sqsubset sqsupset lhd rhd unlhd unrhd
+        therefore because varnothing nexists complement checkmark
+        square blacksquare Box triangleq measuredangle sphericalangle backprime
+        mho beth gimel daleth hslash
+        circledast circledcirc boxplus boxminus boxtimes ltimes rtimes
+        leftrightarrows rightleftarrows twoheadrightarrow rightsquigarrow
+        ulcorner urcorner llcorner lrcorner
+        mathbb mathfrak
+    ''',
+    'amsfonts': '''
+        mathbb mathfrak
+    ''',
+}
+
+KNOWN_LATEX_COMMANDS = frozenset(
+    command
+    for package in ('latex', *LATEX_PACKAGES)
+    for command in LATEX_PACKAGE_COMMANDS[package].split()
+)
+
+KNOWN_LATEX_ENVIRONMENTS = frozenset('''
+    matrix pmatrix bmatrix Bmatrix vmatrix Vmatrix smallmatrix
+    cases aligned gathered split array
+'''.split())
+
+LATEX_TOKEN = re.compile(r'\\(?P<command>[A-Za-z]+)|\\.?|(?P<char>[{}$^_])|[^\\{}$^_]+', re.DOTALL)
+LATEX_ENVIRONMENT = re.compile(r'\{(\w+\*?)\}')
+LATEX_DELIMITER_SIZING = re.compile(r'\\(?:left|right)(?![A-Za-z])\s*\.?')
+
+
+@dataclass(frozen=True)
+class LatexCheck:
+    """Outcome of preflight_latex"""
+    latex: str                      # Input, repaired where possible
+    problems: Tuple[str, ...] = ()  # Problems found, repaired or not
+    ok: bool = True                 # False if the expression would still fail to compile
+    warnings: Tuple[str, ...] = ()  # Commands or characters preflight cannot vouch for; latex decides
+
+
+@lru_cache(maxsize=8192)
+def preflight_latex(latex: str) -> LatexCheck:
+    """
+    Predict whether cleaned LaTeX compiles, without running latex
+    
+    Checks brace, \\left/\\right and \\begin/\\end balance, unknown commands,
+    stray $ and non-ASCII characters. Stray $, unmatched braces, dangling
+    sub/superscripts and mismatched \\left/\\right are repaired; only
+    mismatched \\begin/\\end marks the expression as doomed. Unknown commands,
+    environments and characters are warnings, left for latex to decide.
+    Results are cached per expression.
+    """
+    problems: List[str] = []
+    warnings: List[str] = []
+    fatal = False
+    out: List[str] = []
+    depth = 0
+    sizing = 0
+    sizing_mismatch = False
+    environments: List[str] = []
+    
+    tokens = list(LATEX_TOKEN.finditer(latex))
+    for index, token in enumerate(tokens):
+        text = token.group()
+        command = token.group('command')
+        char = token.group('char')
+        
+        if command:
+            if command not in KNOWN_LATEX_COMMANDS:
+                warnings.append(f"unknown command \\{command}")
+            elif command in ('left', 'right'):
+                sizing += 1 if command == 'left' else -1
+                if sizing < 0:
+                    problems.append("\\right without \\left")
+                    sizing_mismatch = True
+                    sizing = 0
+            elif command in ('begin', 'end'):
+                following = latex[token.end():token.end() + 32]
+                env = LATEX_ENVIRONMENT.match(following)
+                name = env.group(1) if env else ''
+                if name not in KNOWN_LATEX_ENVIRONMENTS:
+                    warnings.append(f"unknown environment {name or '(none)'}")
+                if command == 'begin':
+                    environments.append(name)
+                elif not environments or environments.pop() != name:
+                    problems.append(f"\\end{{{name}}} without matching \\begin")
+                    fatal = True
+        elif char == '$':
+            problems.append("stray $")
+            continue
+        elif text == '\\':
+            problems.append("trailing \\")
+            continue
+        elif char == '{':
+            depth += 1
+        elif char == '}':
+            if depth == 0:
+                problems.append("unmatched }")
+                continue
+            depth -= 1
+        elif char in ('^', '_'):
+            following = tokens[index + 1].group() if index + 1 < len(tokens) else ''
+            if not following.strip() or following in ('}', '^', '_'):
+                problems.append(f"dangling {char}")
+                out.append(char + '{}')
+                continue
+        elif not text.isascii():
+            warnings.append("non-ASCII characters")
+        out.append(text)
+    
+    if depth:
+        problems.append(f"{depth} unclosed {{")
+        out.append('}' * depth)
+    if environments:
+        problems.append(f"unclosed environment {environments[-1]}")
+        fatal = True
+    
+    if sizing:
+        problems.append("\\left without \\right")
+        sizing_mismatch = True
+    
+    repaired = ''.join(out).strip()
+    if sizing_mismatch:
+        # Unsized delimiters still compile, so fall back to those
+        repaired = LATEX_DELIMITER_SIZING.sub('', repaired).strip()
+    
+    return LatexCheck(repaired, tuple(problems), not fatal, tuple(dict.fromkeys(warnings)))
+
+
+def checked_latex(content: str) -> str:
+    """
+    Clean and preflight LaTeX for MathTex
+    
+    Raises:
+        ValueError: If the expression would fail to compile even after repair,
+            so callers go straight to their fallback without a latex run.
+    """
+    check = preflight_latex(clean_latex(content))
+    if not check.ok:
+        raise ValueError(f"LaTeX preflight failed for {content!r}: {', '.join(check.problems)}")
+    if check.problems:
+        print(f"Repaired LaTeX ({', '.join(check.problems)}): {check.latex}")
+    if check.warnings:
+        print(f"Warning: LaTeX {check.latex!r} has {', '.join(check.warnings)}")
+    return check.latex
+
+
+# ---------------------------------------------------------------------------
+# Text layout
+# ---------------------------------------------------------------------------
+
+REFERENCE_FONT_SIZE = 48
+MIN_FONT_SIZE = 20
+TEXT_WIDTH_RATIO = 0.85  # Share of the frame width text may occupy
+TEXT_HEIGHT_RATIO = 0.7  # Share of the frame height text may occupy
+
+
+@dataclass(frozen=True)
+class TextLayout:
+    """Wrapped lines and the font size they fit the frame at"""
+    lines: Tuple[str, ...]
+    font_size: float
+
+
+@lru_cache(maxsize=4096)
+def measure_text_width(text: str, weight: str = "NORMAL") -> float:
+    """Pango-measured width of a single line at REFERENCE_FONT_SIZE"""
+    from manim import Text
+    
+    return Text(text, font_size=REFERENCE_FONT_SIZE, weight=weight).width
+
+
+@lru_cache(maxsize=16)
+def measure_line_metrics(weight: str = "NORMAL") -> Tuple[float, float, float]:
+    """Space width, single line height and line pitch at REFERENCE_FONT_SIZE"""
+    from manim import Text
+    
+    # Pango draws no glyph for a lone space, so measure it between two characters
+    space = measure_text_width("x x", weight) - measure_text_width("xx", weight)
+    one_line = Text("Ag", font_size=REFERENCE_FONT_SIZE, weight=weight).height
+    two_lines = Text("Ag\nAg", font_size=REFERENCE_FONT_SIZE, weight=weight).height
+    return space, one_line, two_lines - one_line
+
+
+def wrap_words(words: Tuple[str, ...], widths: List[float], space: float, max_width: float) -> List[str]:
+    """Greedily pack words into lines no wider than max_width"""
+    lines: List[str] = []
+    current: List[str] = []
+    current_width = 0.0
+    for word, width in zip(words, widths):
+        needed = width if not current else current_width + space + width
+        if current and needed > max_width:
+            lines.append(" ".join(current))
+            current, current_width = [word], width
         else:
-            # Old structure for backward compatibility
-            self.steps = script_data.get('steps', [])
-            self.total_duration = script_data.get('duration', 300)
-            self.use_new_structure = False
-            
-        self.current_time = 0
-        self.active_mobjects = []  # Track objects to prevent cluttering
-        
-    def construct(self):
-        """Main scene construction with perfect timing synchronization"""
-        
-        # Create and show title briefly
-        title_text = self.title.replace('_', ' ').replace('  ', ' ')
-        title = Text(title_text, font_size=44, color=BLUE, weight=BOLD)
-        title.move_to(ORIGIN)
-        
-        self.play(Write(title), run_time=2)
-        self.wait(1)
-        self.play(FadeOut(title), run_time=1)
-        self.current_time += 4
-        
-        if self.use_new_structure:
-            # New structure: Introduction → Sections → Conclusion
-            if self.introduction:
-                self.render_introduction()
+            current.append(word)
+            current_width = needed
+    if current:
+        lines.append(" ".join(current))
+    return lines
+
+
+@lru_cache(maxsize=1024)
+def layout_text(
+    text: str,
+    font_size: float,
+    weight: str,
+    max_width: float,
+    max_height: float,
+) -> TextLayout:
+    """
+    Wrap and shrink text until it fits the given box
+    
+    Word widths are measured once at REFERENCE_FONT_SIZE and scaled, since
+    pango glyph metrics scale linearly with font size. Layouts are cached per
+    (text, style, box), so repeated strings cost nothing after the first.
+    """
+    words = tuple(text.split())
+    if not words:
+        return TextLayout((text,), font_size)
+    
+    widths = [measure_text_width(word, weight) for word in words]
+    space, line_height, line_pitch = measure_line_metrics(weight)
+    
+    size = font_size
+    while True:
+        scale = size / REFERENCE_FONT_SIZE
+        lines = wrap_words(words, [w * scale for w in widths], space * scale, max_width)
+        height = (line_height + line_pitch * (len(lines) - 1)) * scale
+        if height <= max_height or size <= MIN_FONT_SIZE:
+            return TextLayout(tuple(lines), size)
+        size = max(MIN_FONT_SIZE, size - 2)
+
+
+def fitted_text(
+    text: str,
+    font_size: float,
+    color=None,
+    weight: str = "NORMAL",
+    height_ratio: float = TEXT_HEIGHT_RATIO,
+):
+    """Build a centered Text/Paragraph that is wrapped and sized to fit the frame (white by default)"""
+    from manim import config, Paragraph, Text, WHITE
+    
+    color = WHITE if color is None else color
+    max_width = config.frame_width * TEXT_WIDTH_RATIO
+    max_height = config.frame_height * height_ratio
+    layout = layout_text(text, font_size, weight, max_width, max_height)
+    
+    if len(layout.lines) == 1:
+        text_obj = Text(layout.lines[0], font_size=layout.font_size, color=color, weight=weight)
+    else:
+        text_obj = Paragraph(*layout.lines, alignment="center", font_size=layout.font_size, color=color, weight=weight)
+    
+    # Single words wider than the frame still need squeezing in
+    if text_obj.width > max_width:
+        text_obj.scale_to_fit_width(max_width)
+    if text_obj.height > max_height:
+        text_obj.scale_to_fit_height(max_height)
+    return text_obj
+
+
+# ---------------------------------------------------------------------------
+# Visual renderer registry
+# ---------------------------------------------------------------------------
+
+@dataclass
+class VisualPlan:
+    """Mobjects and timed beats produced by a visual renderer's build function"""
+    mobjects: List[Any] = field(default_factory=list)
+    beats: List[Tuple[List[Any], float]] = field(default_factory=list)
+    captures: Dict[int, str] = field(default_factory=dict)  # Beat index -> equation thumbnail label
+    
+    def play(self, *animations, run_time: float, capture: Optional[str] = None) -> "VisualPlan":
+        """Queue animations to be played together, optionally capturing the frame they end on"""
+        if capture is not None:
+            self.captures[len(self.beats)] = capture
+        self.beats.append((list(animations), run_time))
+        return self
+    
+    def wait(self, duration: float) -> "VisualPlan":
+        """Queue a hold on the current frame"""
+        self.beats.append(([], duration))
+        return self
+
+
+@dataclass(frozen=True)
+class VisualRenderer:
+    """Registered visual type: build function plus scheduling metadata"""
+    name: str
+    build: Callable[[str, float, Dict[str, Any]], VisualPlan]
+    estimate_cost: Callable[[str, float], float]
+
+
+VISUAL_RENDERERS: Dict[str, VisualRenderer] = {}
+DEFAULT_VISUAL_TYPE = "text_display"
+
+
+def linear_cost(base: float, per_second: float) -> Callable[[str, float], float]:
+    """Cost estimate of a fixed setup price plus a per-second frame price"""
+    def estimate(content: str, duration: float) -> float:
+        return base + per_second * max(0, duration)
+    return estimate
+
+
+def register_visual(name: str, cost: Callable[[str, float], float]):
+    """
+    Register a build function for a visual type
+    
+    Args:
+        name: Visual type string used in visualSequence entries
+        cost: Estimated render seconds for (content, duration)
+    """
+    def decorator(build: Callable[[str, float, Dict[str, Any]], VisualPlan]):
+        VISUAL_RENDERERS[name] = VisualRenderer(name, build, cost)
+        return build
+    return decorator
+
+
+def get_visual_renderer(visual_type: str) -> VisualRenderer:
+    """Look up a visual renderer, falling back to plain text for unknown types"""
+    return VISUAL_RENDERERS.get(visual_type, VISUAL_RENDERERS[DEFAULT_VISUAL_TYPE])
+
+
+def visual_display_duration(visual: Dict[str, Any]) -> float:
+    """Display duration of a visual, capped at 15s to prevent too long displays"""
+    start_time, end_time = visual.get('timing', [0, 10])
+    return min(end_time - start_time, 15)
+
+
+def estimate_script_cost(script_data: Dict[str, Any]) -> float:
+    """Estimate render seconds for a whole script from its visual renderers"""
+    cost = 0.0
+    for section in script_data.get('sections', []):
+        for visual in section.get('visualSequence', []):
+            renderer = get_visual_renderer(visual.get('type', ''))
+            cost += renderer.estimate_cost(visual.get('content', ''), visual_display_duration(visual))
+    for step in script_data.get('steps', []):
+        if step.get('text'):
+            cost += VISUAL_RENDERERS['text_display'].estimate_cost(step['text'], step.get('duration', 20))
+        if step.get('math'):
+            cost += VISUAL_RENDERERS['math_equation'].estimate_cost(step['math'], step.get('duration', 20))
+    return cost
+
+
+@register_visual("text_display", cost=linear_cost(0.5, 0.05))
+def build_text_display(content: str, duration: float, visual: Dict[str, Any]) -> VisualPlan:
+    """Display text with controlled timing - CLEAN LAYOUT"""
+    from manim import ORIGIN, WHITE, Write
+    
+    text_obj = fitted_text(content, font_size=36, color=WHITE)
+    text_obj.move_to(ORIGIN)
+    
+    animate_time = min(1.5, duration * 0.3)
+    hold_time = max(1, duration - animate_time)
+    
+    return VisualPlan([text_obj]).play(Write(text_obj), run_time=animate_time).wait(hold_time)
+
+
+@register_visual("math_equation", cost=linear_cost(2.0, 0.05))
+def build_math_equation(content: str, duration: float, visual: Dict[str, Any]) -> VisualPlan:
+    """Display math equation with highlighting - CENTERED"""
+    from manim import BLUE, ORIGIN, WHITE, Indicate, MathTex, Write
+    
+    try:
+        math_obj = MathTex(checked_latex(content), font_size=48, color=WHITE)
+        math_obj.move_to(ORIGIN)
+        
+        animate_time = min(2, duration * 0.4)
+        hold_time = max(1, duration - animate_time - 1)
+        
+        return (
+            VisualPlan([math_obj])
+            .play(Write(math_obj), run_time=animate_time, capture=content)
+            .wait(hold_time)
+            .play(Indicate(math_obj, color=BLUE), run_time=1)
+        )
+        
+    except Exception as e:
+        print(f"Math rendering error: {e}")
+        fallback = fitted_text(f"Equation: {content}", font_size=32, color=BLUE)
+        fallback.move_to(ORIGIN)
+        return VisualPlan([fallback]).play(Write(fallback), run_time=duration * 0.5).wait(duration * 0.5)
+
+
+RASTER_AXES_ENV = "BYTE_RASTER_AXES"  # "1" draws graph axes from a pre-rendered background image
+GRAPH_AXES = ((-4, 4, 1), (-3, 3, 1), 8, 6)  # x_range, y_range, x_length, y_length of graph_plot axes
+
+
+@lru_cache(maxsize=16)
+def axes_template(x_range: Tuple[float, ...], y_range: Tuple[float, ...], x_length: float, y_length: float):
+    """
+    Centered axes and axis labels for a configuration, built once per process
+    
+    Tick generation and the label MathTex compiles are most of the cost of a
+    graph, so builders take copies of the template instead of building their own.
+    Never add the returned mobjects to a scene directly.
+    """
+    from manim import BLUE, ORIGIN, Axes
+    
+    axes = Axes(
+        x_range=list(x_range),
+        y_range=list(y_range),
+        x_length=x_length,
+        y_length=y_length,
+        axis_config={"color": BLUE, "stroke_width": 2},
+    )
+    axes.move_to(ORIGIN)
+    labels = axes.get_axis_labels(x_label="x", y_label="y")
+    return axes, labels
+
+
+def graph_axes(config_key: Tuple = GRAPH_AXES):
+    """Fresh copies of the template axes and labels for one graph"""
+    axes, labels = axes_template(*config_key)
+    return axes.copy(), labels.copy()
+
+
+@lru_cache(maxsize=16)
+def axes_background(x_range: Tuple[float, ...], y_range: Tuple[float, ...], x_length: float, y_length: float):
+    """
+    Template axes and labels pre-rendered into a transparent full-frame image
+    
+    Returns the pixel array; wrap it in an ImageMobject per use.
+    """
+    from manim import Camera
+    
+    camera = Camera(background_opacity=0)
+    camera.capture_mobjects(list(axes_template(x_range, y_range, x_length, y_length)))
+    pixels = camera.pixel_array.copy()
+    pixels.setflags(write=False)
+    return pixels
+
+
+def graph_background(config_key: Tuple = GRAPH_AXES):
+    """Image layer showing the template axes, scaled to cover the frame exactly"""
+    from manim import ORIGIN, ImageMobject, config
+    
+    image = ImageMobject(axes_background(*config_key), scale_to_resolution=config.pixel_height)
+    image.move_to(ORIGIN)
+    return image
+
+
+@register_visual("graph_plot", cost=linear_cost(3.0, 0.08))
+def build_graph_plot(content: str, duration: float, visual: Dict[str, Any]) -> VisualPlan:
+    """Display coordinate system and function plot - FOCUSED"""
+    import numpy as np
+    from manim import GREEN, ORANGE, ORIGIN, RED, YELLOW, Create, FadeIn, Text, Write
+    
+    try:
+        # Copies of the shared template; the plot below only needs the axes' coordinate mapping
+        axes, labels = graph_axes()
+        
+        # Add function based on content
+        if "quadratic" in content.lower() or "parabola" in content.lower():
+            func = axes.plot(lambda x: 0.2 * x**2, color=YELLOW, x_range=[-3, 3])
+        elif "linear" in content.lower():
+            func = axes.plot(lambda x: 0.5 * x, color=GREEN, x_range=[-3, 3])
+        elif "sin" in content.lower():
+            func = axes.plot(lambda x: np.sin(x), color=RED, x_range=[-3, 3])
+        else:
+            func = axes.plot(lambda x: x, color=ORANGE, x_range=[-3, 3])
+        
+        axes_time = min(2, duration * 0.4)
+        func_time = min(2, duration * 0.4)
+        remaining_time = max(0.5, duration - axes_time - func_time)
+        
+        if os.environ.get(RASTER_AXES_ENV) == "1":
+            # Axes never move, so draw them as one image instead of re-stroking every tick per frame
+            background = graph_background()
+            plan = VisualPlan([background, func]).play(FadeIn(background), run_time=axes_time)
+        else:
+            plan = VisualPlan([axes, labels, func]).play(Create(axes), Write(labels), run_time=axes_time)
+        
+        return plan.play(Create(func), run_time=func_time).wait(remaining_time)
             
-            for i, section in enumerate(self.sections):
-                self.render_section(section, i)
+    except Exception as e:
+        print(f"Graph error: {e}")
+        fallback = Text("Graph visualization", font_size=32, color=YELLOW)
+        fallback.move_to(ORIGIN)
+        return VisualPlan([fallback]).play(Write(fallback), run_time=duration)
+
+
+@register_visual("step_by_step", cost=linear_cost(1.0, 0.06))
+def build_step_by_step(content: str, duration: float, visual: Dict[str, Any]) -> VisualPlan:
+    """Show step-by-step breakdown - SEQUENTIAL"""
+    from manim import ORIGIN, WHITE, FadeOut, Write
+    
+    steps = content.split('|') if '|' in content else [content]
+    step_duration = max(2, duration / len(steps))
+    
+    plan = VisualPlan()
+    previous = None
+    for i, step in enumerate(steps):
+        # Clear previous step
+        if previous is not None:
+            plan.play(FadeOut(previous), run_time=0.5)
+            
+        step_text = fitted_text(f"Step {i+1}: {step.strip()}", font_size=28, color=WHITE)
+        step_text.move_to(ORIGIN)
+        
+        plan.play(Write(step_text), run_time=min(1.5, step_duration * 0.5))
+        plan.wait(max(0.5, step_duration - 1.5))
+        previous = step_text
+    
+    # Only the last step is still on screen once the plan has played
+    plan.mobjects = [previous]
+    return plan
+
+
+def stagger_windows(count: int, lag_ratio: float = 0.5) -> Tuple["np.ndarray", "np.ndarray"]:
+    """
+    Start/end fractions of one run for `count` overlapping pulses
+    
+    Each pulse starts once the previous one is `lag_ratio` done, matching
+    manim's lag_ratio convention, and all pulses share the same length.
+    """
+    import numpy as np
+    
+    span = 1 + lag_ratio * max(0, count - 1)
+    starts = np.arange(count) * lag_ratio / span
+    return starts, starts + 1 / span
+
+
+def highlight_animations(parts: List[Any], color=None, lag_ratio: float = 0.5) -> List[Any]:
+    """Indicate several sub-expressions in a single animation pass with staggered timing (yellow by default)"""
+    from manim import YELLOW, Indicate, squish_rate_func, there_and_back
+    
+    color = YELLOW if color is None else color
+    starts, ends = stagger_windows(len(parts), lag_ratio)
+    return [
+        Indicate(part, color=color, rate_func=squish_rate_func(there_and_back, float(start), float(end)))
+        for part, start, end in zip(parts, starts, ends)
+    ]
+
+
+def substring_spans(tex: str, substring: str) -> List[Tuple[int, int]]:
+    """(start, end) of every non-overlapping occurrence of substring in tex"""
+    spans = []
+    start = tex.find(substring)
+    while start != -1:
+        spans.append((start, start + len(substring)))
+        start = tex.find(substring, start + len(substring))
+    return spans
+
+
+def isolatable_substrings(tex: str, substrings: List[str]) -> List[str]:
+    """
+    Keep only substrings that split `tex` into brace-balanced, separate pieces
+    
+    MathTex compiles every isolated piece on its own, so a substring that cuts
+    through a group (e.g. the inside of a \\sqrt{...}) would fail to compile.
+    It also splits on whichever substring matches first, so a substring that
+    overlaps another (e.g. 'c' inside '+ c') would pulse the wrong glyphs or
+    nothing; the longer one is kept and the other dropped with a warning.
+    """
+    balanced = []
+    for substring in dict.fromkeys(substrings):
+        if not substring or substring not in tex:
+            continue
+        pieces = re.split(f"({re.escape(substring)})", tex)
+        if all(piece.count('{') == piece.count('}') for piece in pieces):
+            balanced.append(substring)
+    
+    taken: List[Tuple[int, int]] = []
+    kept = set()
+    for substring in sorted(balanced, key=len, reverse=True):
+        spans = substring_spans(tex, substring)
+        if any(start < end_taken and start_taken < end for start, end in spans for start_taken, end_taken in taken):
+            print(f"Warning: not highlighting {substring!r}, it overlaps another highlighted part")
+            continue
+        taken += spans
+        kept.add(substring)
+    return [substring for substring in balanced if substring in kept]
+
+
+@register_visual("highlight_parts", cost=linear_cost(2.0, 0.08))
+def build_highlight_parts(content: str, duration: float, visual: Dict[str, Any]) -> VisualPlan:
+    """
+    Highlight parts of equations or concepts - SELECTIVE
+    
+    Parts come from the visual's optional "highlight" list, given either as
+    LaTeX substrings or as submobject indexes; without it the first three
+    parts are highlighted.
+    """
+    from manim import ORIGIN, WHITE, YELLOW, MathTex, Text, Write
+    
+    try:
+        cleaned = checked_latex(content)
+        requested = visual.get('highlight', [])
+        substrings = isolatable_substrings(
+            cleaned, [clean_latex(item) for item in requested if isinstance(item, str)]
+        )
+        
+        # Create the main equation
+        main_eq = MathTex(cleaned, substrings_to_isolate=substrings, font_size=44, color=WHITE)
+        main_eq.move_to(ORIGIN)
+        
+        write_time = min(2, duration * 0.3)
+        plan = VisualPlan([main_eq]).play(Write(main_eq), run_time=write_time, capture=content)
+        
+        if substrings:
+            parts = [part for substring in substrings for part in main_eq.get_parts_by_tex(substring)]
+        else:
+            indexes = [item for item in requested if isinstance(item, int) and 0 <= item < len(main_eq)]
+            if indexes:
+                parts = [main_eq[i] for i in indexes]
+            else:
+                parts = list(main_eq[:3]) if len(main_eq) > 1 else []  # Limit to first 3 parts to avoid cluttering
+        
+        # Highlight different parts in one staggered pass if we have time
+        remaining_time = duration - write_time
+        if remaining_time > 2 and parts:
+            highlight_time = min(1, remaining_time / len(parts))
+            pulse_time = highlight_time * (1 + 0.5 * (len(parts) - 1))
+            plan.play(*highlight_animations(parts, lag_ratio=0.5), run_time=pulse_time)
+            plan.wait(remaining_time - pulse_time)
+        else:
+            plan.wait(remaining_time)
+        return plan
                 
-            if self.conclusion:
-                self.render_conclusion()
+    except Exception as e:
+        print(f"Highlight error: {e}")
+        fallback = Text("Concept breakdown", font_size=32, color=YELLOW)
+        fallback.move_to(ORIGIN)
+        return VisualPlan([fallback]).play(Write(fallback), run_time=duration)
+
+
+@register_visual("real_world_example", cost=linear_cost(1.0, 0.06))
+def build_real_world_example(content: str, duration: float, visual: Dict[str, Any]) -> VisualPlan:
+    """Show real-world application - CLEAR PRESENTATION"""
+    from manim import BOLD, GREEN, ORIGIN, UP, WHITE, Text, Write
+    
+    title_text = Text("Real-world application:", font_size=32, color=GREEN, weight=BOLD)
+    title_text.to_edge(UP, buff=1.5)
+    
+    # Leave room for the header above the body text
+    content_text = fitted_text(content, font_size=28, color=WHITE, height_ratio=0.5)
+    content_text.move_to(ORIGIN)
+    
+    title_time = min(1, duration * 0.3)
+    content_time = min(1.5, duration * 0.4)
+    wait_time = max(0.5, duration - title_time - content_time)
+    
+    return (
+        VisualPlan([title_text, content_text])
+        .play(Write(title_text), run_time=title_time)
+        .play(Write(content_text), run_time=content_time)
+        .wait(wait_time)
+    )
+
+
+RENDERER_DIR = Path(__file__).resolve().parent
+SCENE_MODULE = RENDERER_DIR / "math_scene.py"  # Imported by the Manim child process
+SCRIPT_PATH_ENV = "BYTE_SCRIPT_PATH"  # Tells the scene module which job file to render
+VARIABLE_FRAME_RATE_ENV = "BYTE_VARIABLE_FRAME_RATE"  # "1" makes the scene write holds as single frames
+DETERMINISTIC_ENV = "BYTE_DETERMINISTIC"  # "1" makes the scene's x264 encodes byte-reproducible
+
+# Manim quality flag and the media subdirectory each preset renders into
+QUALITY_PRESETS = {
+    'low': ('-ql', '480p15'),
+    'medium': ('-qm', '720p30'),
+    'high': ('-qh', '1080p60'),
+    'production': ('-qp', '1440p60'),
+    '4k': ('-qk', '2160p60'),
+}
+DEFAULT_QUALITY = 'low'
+FILE_RELEASE_TIMEOUT = 10.0  # Seconds to wait for other processes to let go of a rendered video
+
+
+def precompile_scene_module():
+    """Refresh the cached bytecode the Manim child process imports the scene from"""
+    import compileall
+    for module in (SCENE_MODULE, RENDERER_DIR / "manim_generator.py"):
+        # Only rewrites stale .pyc files; read-only installs just compile in memory
+        compileall.compile_file(str(module), quiet=2)
+
+
+def setup_manim_environment():
+    """Setup proper environment for Manim with LaTeX"""
+    # Ensure MiKTeX is in PATH
+    miktex_path = os.path.expanduser(r"~\AppData\Local\Programs\MiKTeX\miktex\bin\x64")
+    if os.path.exists(miktex_path) and miktex_path not in os.environ['PATH']:
+        os.environ['PATH'] += os.pathsep + miktex_path
+        print(f"Added MiKTeX to PATH: {miktex_path}")
+    
+    # Create media directory if it doesn't exist
+    media_dir = Path("./media")
+    media_dir.mkdir(exist_ok=True)
+    
+    precompile_scene_module()
+    
+    return True
+
+
+def wait_for_file_release(path: Path, timeout: float = FILE_RELEASE_TIMEOUT) -> bool:
+    """
+    Wait until a file written by a child process that has exited can be opened for writing
+    
+    The child closed the file when it exited, which is all POSIX needs. On
+    Windows a virus scanner or the search indexer may still hold it open for a
+    moment, so opening it is retried with a growing delay until they let go.
+    """
+    if os.name != 'nt':
+        return True
+    import time
+    
+    deadline = time.monotonic() + timeout
+    delay = 0.01
+    while True:
+        try:
+            with open(path, 'r+b'):
+                return True
+        except PermissionError:
+            if time.monotonic() > deadline:
+                print(f"{path} is still in use after {timeout:.0f}s")
+                return False
+            time.sleep(delay)
+            delay = min(delay * 2, 0.25)
+
+
+def render_scene_video(
+    json_data: Dict[str, Any],
+    work_dir: Path,
+    quality: str = DEFAULT_QUALITY,
+    variable_frame_rate: bool = False,
+    raster_axes: bool = False,
+    profile: Optional[str] = None,
+    profile_path: Optional[Path] = None,
+    thumbnails_path: Optional[Path] = None,
+    deterministic: bool = False,
+    timeline_path: Optional[Path] = None,
+) -> Optional[Path]:
+    """
+    Render the Manim scene for a script inside a working directory
+    
+    Args:
+        json_data: Script data dictionary (may carry a farm "segment")
+        work_dir: Directory for the job file and Manim's media output
+        quality: Key of QUALITY_PRESETS
+        variable_frame_rate: Render frozen waits as one frame and let FFmpeg
+            duplicate it back to a constant frame rate when combining
+        raster_axes: Draw graph axes from a pre-rendered background image
+        profile: Profile the scene in one of PROFILE_MODES
+        profile_path: Path prefix for the profile files
+        thumbnails_path: Path prefix for a thumbnail sprite sheet captured while rendering
+        deterministic: Encode with DETERMINISTIC_FFMPEG_FLAGS, so the video is
+            identical on every host
+        timeline_path: File the scene records where each narrated part started in
+        
+    Returns:
+        Path of the rendered silent video, or None on failure
+    """
+    # Hand the script to the scene module through a file instead of generated source
+    job_file = work_dir / "job.json"
+    with open(job_file, 'w', encoding='utf-8') as f:
+        json.dump(json_data, f, ensure_ascii=False)
+    
+    # Run Manim to generate video
+    quality_flag, quality_dir = QUALITY_PRESETS[quality]
+    cmd = [
+        "manim",
+        quality_flag,  # Removed -p to prevent auto-opening
+        "--disable_caching",  # Disable caching to prevent file locks
+        str(SCENE_MODULE),
+        "MathVideoScene"
+    ]
+    env = dict(os.environ, **{
+        SCRIPT_PATH_ENV: str(job_file),
+        VARIABLE_FRAME_RATE_ENV: "1" if variable_frame_rate else "0",
+        RASTER_AXES_ENV: "1" if raster_axes else "0",
+        PROFILE_ENV: profile or "",
+        PROFILE_PATH_ENV: str(profile_path) if profile else "",
+        THUMBNAILS_PATH_ENV: str(thumbnails_path or ""),
+        DETERMINISTIC_ENV: "1" if deterministic else "0",
+        TIMELINE_PATH_ENV: str(timeline_path or ""),
+    })
+    
+    print(f"Running Manim command: {' '.join(cmd)}")
+    result = subprocess.run(cmd, capture_output=True, text=True, cwd=str(work_dir), env=env)
+    
+    if result.returncode != 0:
+        print(f"Manim error: {result.stderr}")
+        return None
+    
+    print("Manim rendering completed successfully")
+    
+    # Find generated video
+    media_dir = work_dir / "media" / "videos" / SCENE_MODULE.stem / quality_dir
+    video_files = list(media_dir.glob("*.mp4"))
+    
+    if not video_files:
+        print("No video file generated")
+        return None
+    
+    print(f"Found generated video: {video_files[0]}")
+    wait_for_file_release(video_files[0])
+    return video_files[0]
+
+
+def finalize_video(
+    generated_video: Path,
+    output_path: str,
+    audio_path: str = None,
+    deterministic: bool = False,
+    subtitles_path: Optional[Path] = None,
+) -> bool:
+    """Mux narration (and captions, if given) into the rendered video, or remux it as-is without audio"""
+    subtitles = str(subtitles_path) if subtitles_path else None
+    # If audio is provided, combine audio and video
+    if audio_path and os.path.exists(audio_path):
+        prepared = prepare_audio(audio_path)
+        print("Combining video with audio...")
+        if prepared is not None:
+            success = combine_audio_video(
+                str(generated_video), str(prepared.path), output_path, deterministic,
+                audio_codec="copy", subtitles_path=subtitles,
+            )
         else:
-            # Old structure: Steps
-            self.render_legacy_steps()
-            
-        # Final pause to reach exact duration
-        remaining_time = max(0, self.total_duration - self.current_time)
-        if remaining_time > 0:
-            self.wait(remaining_time)
-    
-    def clear_scene(self):
-        """Clear active objects to prevent cluttering"""
-        if self.active_mobjects:
-            self.play(*[FadeOut(mob) for mob in self.active_mobjects], run_time=0.5)
-            self.active_mobjects.clear()
-    
-    def add_to_scene(self, mobject):
-        """Add object to scene and track it"""
-        self.active_mobjects.append(mobject)
-        return mobject
-    
-    def render_legacy_steps(self):
-        """Render old-style steps for backward compatibility"""
-        for i, step in enumerate(self.steps):
-            text_content = step.get('text', '')
-            math_content = step.get('math', '')
-            step_duration = step.get('duration', 20)
-            
-            # Clear previous content
-            if i > 0:
-                self.clear_scene()
-            
-            # Show text
-            if text_content:
-                text_obj = Text(text_content, font_size=32, color=WHITE)
-                text_obj.to_edge(UP, buff=1)
-                self.add_to_scene(text_obj)
-                self.play(Write(text_obj), run_time=1.5)
-            
-            # Show math
-            if math_content:
-                try:
-                    cleaned_math = self.clean_latex(math_content)
-                    math_obj = MathTex(cleaned_math, font_size=44, color=WHITE)
-                    math_obj.move_to(ORIGIN)
-                    self.add_to_scene(math_obj)
-                    self.play(Write(math_obj), run_time=2)
-                    self.play(Indicate(math_obj, color=BLUE), run_time=1)
-                except Exception as e:
-                    print(f"Math error: {e}")
-                    fallback = Text(f"Math: {math_content}", font_size=28, color=BLUE)
-                    fallback.move_to(ORIGIN)
-                    self.add_to_scene(fallback)
-                    self.play(Write(fallback), run_time=1.5)
-            
-            # Wait for remaining time
-            used_time = 4.5 if text_content and math_content else 3 if text_content or math_content else 1
-            remaining = max(0.5, step_duration - used_time)
-            self.wait(remaining)
-            self.current_time += step_duration
-        """Render introduction with timing control"""
-        intro = self.introduction
-        intro_text = intro.get('text', '')
-        duration = intro.get('duration', 30)
-        
-        if intro_text:
-            # Create centered introduction text
-            intro_obj = Text(intro_text, font_size=36, color=WHITE)
-            intro_obj.move_to(ORIGIN)
-            
-            self.play(Write(intro_obj), run_time=2)
-            self.wait(duration - 4)  # Account for write and fade time
-            self.play(FadeOut(intro_obj), run_time=2)
-            
-        self.current_time += duration
+            # Captions were timed without the audio, so they could cut the video short here
+            if subtitles:
+                print("Narration could not be preprocessed; captions are not muxed")
+            success = combine_audio_video(str(generated_video), audio_path, output_path, deterministic)
+    else:
+        # Remux rather than copy so the mp4 is laid out for the output target
+        print("Remuxing video without audio...")
+        success = remux_video(str(generated_video), output_path, deterministic, subtitles)
+    
+    if success and deterministic and not is_stream_output(output_path):
+        print(f"Content hash: sha256:{file_sha256(output_path)}")
+    return success
+
+
+def generate_video_from_json(
+    json_data: Dict[str, Any],
+    output_path: str,
+    audio_path: str = None,
+    deterministic: bool = False,
+    quality: str = DEFAULT_QUALITY,
+    variable_frame_rate: bool = False,
+    raster_axes: bool = False,
+    sync_sections: bool = False,
+    use_cache: bool = True,
+    limits: Optional["RenderLimits"] = None,
+    profile: Optional[str] = None,
+    thumbnails: bool = False,
+    captions: Optional[str] = None,
+    mux_captions: bool = False,
+    renditions: Tuple[str, ...] = (),
+) -> bool:
+    """
+    Generate video from JSON script data
+    
+    Args:
+        json_data: Script data dictionary
+        output_path: Where to save the video, "-" for stdout or a named pipe
+        audio_path: Optional audio file path
+        deterministic: Produce byte-identical output for identical inputs
+        quality: Key of QUALITY_PRESETS
+        variable_frame_rate: Render holds as single frames (see render_scene_video)
+        raster_axes: Draw graph axes from a pre-rendered background image
+        sync_sections: Start each section when its narration starts in the audio
+        use_cache: Reuse a cached result for an identical job, and cache this one
+        limits: Wait for a host-wide render slot before rendering (cache hits skip the wait)
+        profile: Profile the render in one of PROFILE_MODES, writing next to the output
+        thumbnails: Write a thumbnail sprite sheet and index next to the output
+        captions: Write a caption track in one of CAPTION_FORMATS next to the output
+        mux_captions: Also mux the captions as a soft subtitle stream (WebVTT unless
+            captions names a format)
+        renditions: Keys of RENDITION_HEIGHTS to downscale the output to as well,
+            written next to it (e.g. test.480p.mp4)
+        
+    Returns:
+        bool: Success status
+        
+    Raises:
+        RenderBusy: If limits are given and no render slot became available, or
+            a deterministic render of the same script held its work directory
+            past the queue timeout
+    """
+    try:
+        thumbnails_prefix = sidecar_prefix(output_path, "thumbnails") if thumbnails else None
+        caption_format = captions or ("vtt" if mux_captions else None)
+        captions_prefix = sidecar_prefix(output_path, "captions") if caption_format else None
+        script_data = json_data
+        fingerprint = None
+        if use_cache:
+            fingerprint = job_fingerprint(
+                json_data, audio_path,
+                mux_captions=mux_captions,
+                deterministic=deterministic,
+                quality=quality,
+                variable_frame_rate=variable_frame_rate,
+                raster_axes=raster_axes,
+                sync_sections=sync_sections,
+            )
+            # A profiled job has to render, but its output can still refresh the cache
+            if not profile and cached_job_captions(
+                fingerprint, script_data, audio_path, captions_prefix, caption_format
+            ) and cached_job_output(fingerprint, output_path, deterministic, thumbnails_prefix, renditions):
+                return True
+        
+        with render_slot(limits) if limits else nullcontext():
+            # Setup environment
+            setup_manim_environment()
+            
+            if sync_sections:
+                json_data = synced_script(json_data, audio_path)
+            
+            # Create working directory
+            with render_work_dir(json_data, deterministic, limits.queue_timeout if limits else None) as work_dir:
+                generated_video = render_scene_video(
+                    json_data, work_dir, quality, variable_frame_rate, raster_axes,
+                    profile=profile,
+                    profile_path=sidecar_prefix(output_path, "profiles") if profile else None,
+                    thumbnails_path=thumbnails_prefix,
+                    deterministic=deterministic,
+                    timeline_path=work_dir / "timeline.json",
+                )
+                if generated_video is None:
+                    return False
+                
+                captions_path = None
+                if caption_format:
+                    captions_path = write_captions(
+                        script_data, audio_path, captions_prefix, caption_format,
+                        timeline=read_timeline(work_dir / "timeline.json"),
+                    )
+                return finalize_job(
+                    generated_video, output_path, audio_path, deterministic, fingerprint, thumbnails_prefix,
+                    subtitles_path=captions_path if mux_captions else None,
+                    renditions=renditions,
+                    timeline_path=work_dir / "timeline.json",
+                )
+    
+    except RenderBusy:
+        raise
+    except Exception as e:
+        print(f"Error generating video: {e}")
+        return False
+
+
+# Output flags that make FFmpeg's output byte-reproducible: no creation time or
+# copied metadata, no version-specific encoder tags, single-threaded encoders
+# (x264's output depends on its thread count, which defaults to the CPU count).
+# Every FFmpeg run of a deterministic render gets them, the scene's x264
+# encodes included.
+DETERMINISTIC_FFMPEG_FLAGS = [
+    "-map_metadata", "-1",
+    "-fflags", "+bitexact",
+    "-flags:v", "+bitexact",
+    "-flags:a", "+bitexact",
+    "-threads", "1",
+]
+
+
+# ---------------------------------------------------------------------------
+# Output targets
+#
+# Regular files get a faststart mp4 (moov atom first) so uploads and players can
+# start before the whole file is read. "-" (stdout) and named pipes cannot be
+# seeked back into, so they get a fragmented mp4 that is written front to back.
+# ---------------------------------------------------------------------------
+
+STDOUT_OUTPUT = "-"
+FASTSTART_MP4_FLAGS = ["-movflags", "+faststart"]
+FRAGMENTED_MP4_FLAGS = ["-movflags", "frag_keyframe+empty_moov+default_base_moof", "-f", "mp4"]
+
+
+def is_stream_output(output_path: str) -> bool:
+    """Whether the output is stdout or a named pipe rather than a seekable file"""
+    if output_path == STDOUT_OUTPUT:
+        return True
+    import stat
+    try:
+        return stat.S_ISFIFO(os.stat(output_path).st_mode)
+    except OSError:
+        return False
+
+
+def sidecar_prefix(output_path: str, cache_subdir: str) -> Path:
+    """Path prefix for files written alongside the output; streams get one in the cache"""
+    import time
+    
+    if is_stream_output(output_path):
+        return render_cache_dir(cache_subdir) / f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+    return Path(output_path).with_suffix('')
+
+
+def ffmpeg_output_args(output_path: str) -> List[str]:
+    """FFmpeg muxer flags and output target for the final video"""
+    if output_path == STDOUT_OUTPUT:
+        return [*FRAGMENTED_MP4_FLAGS, "pipe:1"]
+    if is_stream_output(output_path):
+        return [*FRAGMENTED_MP4_FLAGS, output_path]
+    return [*FASTSTART_MP4_FLAGS, output_path]
+
+
+def run_ffmpeg_to_output(cmd: List[str], output_path: str) -> subprocess.CompletedProcess:
+    """Run an FFmpeg command writing the final video, letting it inherit stdout when streaming"""
+    stdout = None if output_path == STDOUT_OUTPUT else subprocess.PIPE
+    return subprocess.run(cmd, stdout=stdout, stderr=subprocess.PIPE, text=True)
+
+
+def script_fingerprint(json_data: Dict[str, Any]) -> str:
+    """Stable hash of a script, independent of key order and whitespace"""
+    normalized = json.dumps(json_data, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+def file_sha256(path: str) -> str:
+    """Content hash of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def media_duration(path: str) -> Optional[float]:
+    """Container duration in seconds from ffprobe, None if it cannot be read"""
+    try:
+        result = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path],
+            capture_output=True, text=True,
+        )
+        return float(result.stdout.strip())
+    except (OSError, ValueError):
+        return None
+
+
+def remux_video(
+    video_path: str,
+    output_path: str,
+    deterministic: bool = False,
+    subtitles_path: Optional[str] = None,
+) -> bool:
+    """Stream-copy a video to the output, stripping run-specific metadata if deterministic"""
+    length_args = []
+    if subtitles_path:
+        # The subtitle stream ends at its last cue, which must not stretch the video
+        length = media_duration(video_path)
+        length_args = ["-t", f"{length:.3f}"] if length else []
+    
+    cmd = [
+        "ffmpeg", "-i", video_path,
+        *(["-i", subtitles_path] if subtitles_path else []),
+        "-map", "0", "-c", "copy",
+        *(subtitle_stream_args(1) if subtitles_path else []),  # Its -c:s overrides the copy
+        *length_args,
+        *(DETERMINISTIC_FFMPEG_FLAGS if deterministic else []),
+        "-y", *ffmpeg_output_args(output_path),
+    ]
+    print(f"Remuxing video: {' '.join(cmd)}")
+    result = run_ffmpeg_to_output(cmd, output_path)
+    if result.returncode != 0:
+        print(f"FFmpeg remux error: {result.stderr}")
+        return False
+    return True
+
+
+@contextmanager
+def render_work_dir(json_data: Dict[str, Any], deterministic: bool = False, timeout: Optional[float] = None):
+    """
+    Working directory for one render
+    
+    Deterministic renders use a directory named after the script hash instead
+    of a random one, so every path handed to Manim and FFmpeg is identical
+    between runs of the same script. Concurrent renders of the same script
+    would share that directory, so each holds a lock on it for the whole
+    render and the others wait their turn, for at most `timeout` seconds
+    (DEFAULT_QUEUE_TIMEOUT if None).
+    
+    Raises:
+        RenderBusy: If another render of the same script held the directory
+            for longer than `timeout`
+    """
+    if not deterministic:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            yield Path(temp_dir)
+        return
+    
+    import shutil
+    import time
+    work_dir = Path(tempfile.gettempdir()) / f"byte-render-{script_fingerprint(json_data)[:16]}"
+    # The lock file is never removed: deleting it would let a waiting render lock a stale inode
+    lock_path = work_dir.with_name(f"{work_dir.name}.lock")
+    deadline = time.monotonic() + (DEFAULT_QUEUE_TIMEOUT if timeout is None else timeout)
+    lock = lock_file(lock_path)
+    while lock is None:
+        if time.monotonic() >= deadline:
+            raise RenderBusy("Renderer busy: the same script is already rendering in deterministic mode")
+        time.sleep(SLOT_POLL_INTERVAL)
+        lock = lock_file(lock_path)
+    try:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        work_dir.mkdir(parents=True)
+        try:
+            yield work_dir
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    finally:
+        lock.close()
+
+
+# ---------------------------------------------------------------------------
+# Audio stage: narration is decoded, trimmed, normalized and encoded to AAC once
+# per distinct file, so the final mux is a plain stream copy
+# ---------------------------------------------------------------------------
+
+CACHE_DIR_ENV = "BYTE_RENDER_CACHE"  # Overrides the default ~/.cache/byte-renderer
+AUDIO_STAGE_VERSION = 3  # Bump when the processing below changes to invalidate cached audio
+AUDIO_TARGET_DBFS = -18.0  # Average loudness narration is normalized to
+AUDIO_PEAK_HEADROOM = 1.0  # dB kept free below full scale when normalizing
+AUDIO_SILENCE_THRESHOLD = -50.0  # dBFS below which trailing audio counts as silence
+AUDIO_SILENCE_PADDING_MS = 100  # Silence kept at the end after trimming
+AUDIO_BITRATE = "192k"
+PAUSE_WINDOW = 0.02  # Seconds per energy window when looking for pauses
+PAUSE_MIN_LENGTH = 0.3  # Shortest gap in speech that counts as a pause
+PAUSE_RELATIVE_DB = 30.0  # Windows this far below the speech level are silent
+
+
+@dataclass(frozen=True)
+class PreparedAudio:
+    """Narration processed by prepare_audio"""
+    path: Path          # AAC audio in an m4a container
+    duration: float     # Seconds, after trimming
+    pauses: Tuple[Tuple[float, float], ...] = ()  # (start, end) of pauses in speech, in seconds
+
+
+def find_pauses(samples: "np.ndarray", sample_rate: int) -> List[Tuple[float, float]]:
+    """
+    Locate pauses in mono PCM from short-window RMS energy
+    
+    Windows more than PAUSE_RELATIVE_DB below the loud (90th percentile)
+    windows are silent; runs of at least PAUSE_MIN_LENGTH become pauses.
+    Fully vectorized, so a five-minute track takes a few milliseconds.
+    """
+    import numpy as np
+    
+    window = max(1, int(sample_rate * PAUSE_WINDOW))
+    count = len(samples) // window
+    if count == 0:
+        return []
+    frames = np.asarray(samples[:count * window], dtype=np.float32).reshape(count, window)
+    level = 10 * np.log10(np.mean(frames * frames, axis=1) + 1e-12)
+    silent = level < max(np.percentile(level, 90) - PAUSE_RELATIVE_DB, AUDIO_SILENCE_THRESHOLD)
+    
+    edges = np.diff(np.concatenate(([0], silent.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    keep = (ends - starts) * PAUSE_WINDOW >= PAUSE_MIN_LENGTH
+    step = window / sample_rate
+    return [(float(start * step), float(end * step)) for start, end in zip(starts[keep], ends[keep])]
+
+
+def narration_section_starts(script_data: Dict[str, Any], audio: PreparedAudio) -> List[float]:
+    """
+    Estimate when each section's narration starts in the prepared audio
+    
+    Each narrated part (introduction, sections, conclusion) is expected to
+    take a share of the audio proportional to its text length; each section
+    start is then snapped to the end of the nearest later pause, i.e. the
+    moment speech resumes.
+    """
+    introduction = script_data.get('introduction') or {}
+    conclusion = script_data.get('conclusion') or {}
+    texts = [introduction.get('text', '')]
+    texts += [section.get('narration', '') for section in script_data.get('sections', [])]
+    texts.append(conclusion.get('text', ''))
+    
+    total_chars = sum(len(text) for text in texts) or 1
+    # The narration's leading silence is not a pause between parts
+    speech_resumes = [end for start, end in audio.pauses if start > 0]
+    
+    starts = []
+    elapsed_chars = len(texts[0])
+    previous = 0.0
+    for text in texts[1:-1]:
+        expected = audio.duration * elapsed_chars / total_chars
+        # Leave room for the section to be a few seconds off either way
+        tolerance = max(2.0, 0.15 * audio.duration * len(text) / total_chars)
+        candidates = [t for t in speech_resumes if t > previous and abs(t - expected) <= tolerance]
+        start = min(candidates, key=lambda t: abs(t - expected)) if candidates else max(expected, previous)
+        if elapsed_chars == 0:
+            start = 0.0  # Nothing is narrated before the first section
+        starts.append(start)
+        previous = start
+        elapsed_chars += len(text)
+    return starts
+
+
+def synced_script(script_data: Dict[str, Any], audio_path: Optional[str]) -> Dict[str, Any]:
+    """
+    Copy of a script with sections timed to their narration
+    
+    Sections get an "audioStart" (seconds into the video) and the script an
+    "audioDuration"; MathVideoScene waits for those instead of relying on the
+    declared durations. Scripts without sections or usable audio are
+    returned unchanged.
+    """
+    if not audio_path or not os.path.exists(audio_path) or not script_data.get('sections'):
+        return script_data
+    audio = prepare_audio(audio_path)
+    if audio is None:
+        return script_data
+    
+    starts = narration_section_starts(script_data, audio)
+    sections = [dict(section, audioStart=round(start, 3)) for section, start in zip(script_data['sections'], starts)]
+    print(f"Synced {len(sections)} sections to narration pauses: {', '.join(f'{s:.1f}s' for s in starts)}")
+    return dict(script_data, sections=sections, audioDuration=round(audio.duration, 3))
+
+
+def render_cache_dir(*parts: str) -> Path:
+    """Directory under the render cache, created on demand"""
+    root = os.environ.get(CACHE_DIR_ENV) or Path.home() / ".cache" / "byte-renderer"
+    path = Path(root, *parts)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def prepare_audio(audio_path: str) -> Optional[PreparedAudio]:
+    """
+    Decode, trim and loudness-normalize narration, cached by content hash
+    
+    Args:
+        audio_path: Narration in any format FFmpeg can decode
+        
+    Returns:
+        PreparedAudio, or None if the audio could not be processed
+    """
+    cache_dir = render_cache_dir("audio")
+    key = f"{file_sha256(audio_path)[:32]}-v{AUDIO_STAGE_VERSION}"
+    prepared_path = cache_dir / f"{key}.m4a"
+    info_path = cache_dir / f"{key}.json"
+    
+    if prepared_path.exists() and info_path.exists():
+        with open(info_path, 'r', encoding='utf-8') as f:
+            info = json.load(f)
+        print(f"Using cached audio {prepared_path.name} ({info['duration']:.2f}s)")
+        return PreparedAudio(prepared_path, info['duration'], tuple(map(tuple, info['pauses'])))
+    
+    try:
+        import numpy as np
+        from pydub import AudioSegment
+        from pydub.silence import detect_leading_silence
+        
+        audio = AudioSegment.from_file(audio_path)
+        
+        # Trim trailing silence, keeping a little padding. Leading silence is
+        # kept: the audio is muxed from the first frame, so trimming it would
+        # shift the narration earlier against the visuals
+        trail = max(0, detect_leading_silence(audio.reverse(), AUDIO_SILENCE_THRESHOLD) - AUDIO_SILENCE_PADDING_MS)
+        if trail < len(audio):
+            audio = audio[:len(audio) - trail]
+        
+        # Normalize average loudness without pushing peaks into clipping
+        if audio.max_dBFS != float('-inf'):
+            gain = min(AUDIO_TARGET_DBFS - audio.dBFS, -AUDIO_PEAK_HEADROOM - audio.max_dBFS)
+            audio = audio.apply_gain(gain)
+        
+        tmp_path = prepared_path.with_name(f".{prepared_path.name}.{os.getpid()}.tmp")
+        audio.export(
+            str(tmp_path),
+            format="ipod",  # FFmpeg's m4a muxer
+            codec="aac",
+            bitrate=AUDIO_BITRATE,
+            parameters=["-fflags", "+bitexact", "-flags:a", "+bitexact", "-map_metadata", "-1"],
+        )
+        os.replace(tmp_path, prepared_path)
+        
+        # Analyze the same PCM that was just encoded, so pause times match the muxed audio
+        mono = audio.set_channels(1)
+        samples = np.array(mono.get_array_of_samples(), dtype=np.float32) / (1 << (8 * mono.sample_width - 1))
+        pauses = find_pauses(samples, mono.frame_rate)
+        
+        duration = len(audio) / 1000
+        write_atomic(info_path, json.dumps({'duration': duration, 'pauses': pauses}))
+        print(f"Prepared audio: {duration:.2f}s, trimmed {trail}ms trailing silence, {len(pauses)} pauses")
+        return PreparedAudio(prepared_path, duration, tuple(pauses))
+        
+    except Exception as e:
+        print(f"Audio preprocessing failed, muxing the original audio: {e}")
+        return None
+
+
+# ---------------------------------------------------------------------------
+# Captions: a WebVTT/SRT track built from the script's narration, timed to the
+# prepared audio when there is one and otherwise to the timeline the scene
+# recorded while rendering (sections only last as long as their visuals, so
+# the declared durations say little about where they land in the video)
+# ---------------------------------------------------------------------------
+
+CAPTION_FORMATS = ("vtt", "srt")
+CAPTION_LINE_CHARS = 42  # Longest caption line, the usual broadcast limit
+CAPTION_MAX_LINES = 2
+CAPTION_LANGUAGE = "eng"  # ISO 639-2 tag of the muxed subtitle stream
+TIMELINE_PATH_ENV = "BYTE_TIMELINE_PATH"  # File the scene records its part starts and length in
+
+
+def write_timeline(path: Path, starts: Dict[str, float], duration: float):
+    """Write where each narrated part of a render started, and the render's length"""
+    write_atomic(path, json.dumps({'duration': round(duration, 3), 'starts': starts}))
+
+
+def read_timeline(path: Path) -> Optional[Dict[str, Any]]:
+    """Timeline written by write_timeline, None if missing or unreadable"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def merge_timelines(timelines: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Timeline of consecutive renders played back to back, like stitched farm segments"""
+    starts: Dict[str, float] = {}
+    offset = 0.0
+    for timeline in timelines:
+        for part, start in timeline['starts'].items():
+            starts[part] = round(offset + start, 3)
+        offset += timeline['duration']
+    return {'duration': round(offset, 3), 'starts': starts}
+
+
+def caption_parts(
+    script_data: Dict[str, Any],
+    audio: Optional[PreparedAudio] = None,
+    timeline: Optional[Dict[str, Any]] = None,
+) -> List[Tuple[str, float, float]]:
+    """
+    Narrated parts of a script as (text, start, end) seconds into the video
+    
+    Timed to the audio when given, otherwise to the rendered timeline (which
+    is then required).
+    """
+    sections = script_data.get('sections', [])
+    if not sections:
+        narration = script_data.get('narration', '')
+        end = audio.duration if audio else timeline['duration']
+        return [(narration, 0.0, end)] if narration.strip() else []
+    
+    introduction = script_data.get('introduction') or {}
+    conclusion = script_data.get('conclusion') or {}
+    texts = [introduction.get('text', '')]
+    texts += [section.get('narration', '') for section in sections]
+    texts.append(conclusion.get('text', ''))
+    
+    if audio is not None:
+        # Same estimate the section sync uses, so captions change with the visuals
+        total_chars = sum(len(text) for text in texts) or 1
+        starts = [0.0, *narration_section_starts(script_data, audio)]
+        starts.append(max(starts[-1], audio.duration * (total_chars - len(texts[-1])) / total_chars))
+        end = audio.duration
+    else:
+        # Parts the scene skipped (no introduction, say) have no start and are left out
+        recorded = timeline['starts']
+        parts = ['introduction', *(f"section-{i}" for i in range(len(sections))), 'conclusion']
+        starts = [recorded.get(part) for part in parts]
+        end = timeline['duration']
+    
+    timed = [(text, start) for text, start in zip(texts, starts) if start is not None]
+    bounds = [start for _, start in timed[1:]] + [end]
+    return [(text, start, stop) for (text, start), stop in zip(timed, bounds) if text.strip() and stop > start]
+
+
+def caption_cues(text: str, start: float, end: float) -> List[Tuple[float, float, str]]:
+    """Split one part's text into cues of at most two lines, sharing its time by length"""
+    import textwrap
+    
+    chunks = []
+    words = []
+    for word in text.split():
+        candidate = " ".join([*words, word])
+        if words and len(textwrap.wrap(candidate, CAPTION_LINE_CHARS)) > CAPTION_MAX_LINES:
+            chunks.append(words)
+            words = []
+        words.append(word)
+        # End a cue at a sentence boundary once it holds half a line
+        if word[-1] in ".!?" and len(" ".join(words)) >= CAPTION_LINE_CHARS // 2:
+            chunks.append(words)
+            words = []
+    if words:
+        chunks.append(words)
+    
+    lines = [textwrap.wrap(" ".join(chunk), CAPTION_LINE_CHARS) for chunk in chunks]
+    weights = [len(" ".join(chunk)) + 1 for chunk in chunks]
+    total = sum(weights)
+    cues = []
+    elapsed = 0
+    for chunk_lines, weight in zip(lines, weights):
+        cue_start = start + (end - start) * elapsed / total
+        elapsed += weight
+        cues.append((cue_start, start + (end - start) * elapsed / total, "\n".join(chunk_lines)))
+    return cues
+
+
+def caption_timestamp(seconds: float, separator: str) -> str:
+    """HH:MM:SS.mmm (WebVTT) or HH:MM:SS,mmm (SRT)"""
+    millis = round(seconds * 1000)
+    hours, millis = divmod(millis, 3_600_000)
+    minutes, millis = divmod(millis, 60_000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}{separator}{millis:03d}"
+
+
+def format_captions(cues: List[Tuple[float, float, str]], caption_format: str) -> str:
+    """Caption file contents in one of CAPTION_FORMATS"""
+    separator = "." if caption_format == "vtt" else ","
+    blocks = ["WEBVTT\n"] if caption_format == "vtt" else []
+    for i, (start, end, text) in enumerate(cues, 1):
+        timing = f"{caption_timestamp(start, separator)} --> {caption_timestamp(end, separator)}"
+        blocks.append(f"{timing}\n{text}\n" if caption_format == "vtt" else f"{i}\n{timing}\n{text}\n")
+    return "\n".join(blocks)
+
+
+def write_captions(
+    script_data: Dict[str, Any],
+    audio_path: Optional[str],
+    prefix: Path,
+    caption_format: str = "vtt",
+    timeline: Optional[Dict[str, Any]] = None,
+) -> Optional[Path]:
+    """
+    Write a caption track for a script next to `prefix`
+    
+    Args:
+        script_data: Script data dictionary
+        audio_path: Narration the captions are timed to, if any
+        prefix: Path prefix of the caption file
+        caption_format: One of CAPTION_FORMATS
+        timeline: Timeline the scene recorded, used when there is no audio
+        
+    Returns:
+        Path of the caption file, or None if the script has no narration
+    """
+    audio = prepare_audio(audio_path) if audio_path and os.path.exists(audio_path) else None
+    if audio is None and timeline is None:
+        print("No audio or rendered timeline to time captions to; captions skipped")
+        return None
+    cues = [cue for part in caption_parts(script_data, audio, timeline) for cue in caption_cues(*part)]
+    if not cues:
+        return None
+    path = Path(f"{prefix}.{caption_format}")
+    path.write_text(format_captions(cues, caption_format), encoding='utf-8')
+    print(f"Wrote {len(cues)} captions: {path}")
+    return path
+
+
+def subtitle_stream_args(input_index: int) -> List[str]:
+    """FFmpeg flags muxing a caption input as the mp4's soft subtitle stream"""
+    return [
+        "-map", f"{input_index}:s:0",
+        "-c:s", "mov_text",
+        "-metadata:s:s:0", f"language={CAPTION_LANGUAGE}",
+    ]
+
+
+# ---------------------------------------------------------------------------
+# Renditions
+#
+# Smaller copies of the output for other devices are cut from the finished
+# video instead of being rendered again: one FFmpeg pass decodes it once, splits
+# the frames in its filter graph, scales and encodes each branch, and copies the
+# audio and caption streams into every rendition.
+# ---------------------------------------------------------------------------
+
+RENDITION_HEIGHTS = {'360p': 360, '480p': 480, '720p': 720, '1080p': 1080, '1440p': 1440}
+RENDITION_CRF = 23  # x264 quality of the downscaled encodes
+
+
+def preset_height(quality: str) -> int:
+    """Frame height a quality preset renders at"""
+    return int(QUALITY_PRESETS[quality][1].split('p')[0])
+
+
+def rendition_path(output_path: str, rendition: str) -> str:
+    """Where a rendition of the output is written, e.g. test.mp4 -> test.480p.mp4"""
+    path = Path(output_path)
+    return str(path.with_name(f"{path.stem}.{rendition}{path.suffix or '.mp4'}"))
+
+
+def cached_rendition_path(cached: Path, rendition: str) -> Path:
+    """Where a rendition of a cached video is kept"""
+    return cached.with_name(f"{cached.stem}.{rendition}.mp4")
+
+
+def encode_renditions(source: str, outputs: Dict[str, str], deterministic: bool = False) -> bool:
+    """
+    Downscale a finished video to several renditions in one FFmpeg pass
+    
+    Args:
+        source: Finished video, with its audio and caption streams
+        outputs: Rendition name (a key of RENDITION_HEIGHTS) to output path
+        deterministic: Strip timestamps/encoder tags and pin encoder threads
+        
+    Returns:
+        bool: Success status
+    """
+    names = list(outputs)
+    filter_graph = ";".join([
+        f"[0:v]split={len(names)}" + "".join(f"[s{i}]" for i in range(len(names))),
+        *(f"[s{i}]scale=-2:{RENDITION_HEIGHTS[name]}:flags=lanczos,setsar=1[r{i}]" for i, name in enumerate(names)),
+    ])
+    cmd = ["ffmpeg", "-i", source, "-filter_complex", filter_graph, "-y"]
+    for i, name in enumerate(names):
+        cmd += [
+            "-map", f"[r{i}]", "-map", "0:a?", "-map", "0:s?",
+            "-c:v", "libx264", "-crf", str(RENDITION_CRF), "-pix_fmt", "yuv420p",
+            "-c:a", "copy", "-c:s", "copy",
+            *(DETERMINISTIC_FFMPEG_FLAGS if deterministic else []),
+            *FASTSTART_MP4_FLAGS, outputs[name],
+        ]
+    
+    print(f"Encoding renditions {', '.join(names)}: {' '.join(cmd)}")
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        print(f"FFmpeg rendition error: {result.stderr}")
+        return False
+    return True
+
+
+def deliver_renditions(
+    cached: Path,
+    output_path: str,
+    renditions: Tuple[str, ...],
+    deterministic: bool = False,
+) -> bool:
+    """Copy a job's renditions out of the cache, encoding the ones not cached yet from its video"""
+    missing = [rendition for rendition in renditions if not cached_rendition_path(cached, rendition).exists()]
+    if missing:
+        # Encode under temporary names so a failed pass never leaves a truncated rendition cached
+        tmp_paths = {
+            rendition: str(cached.with_name(f".{cached.stem}.{rendition}.{os.getpid()}.tmp.mp4"))
+            for rendition in missing
+        }
+        success = encode_renditions(str(cached), tmp_paths, deterministic)
+        for rendition, tmp_path in tmp_paths.items():
+            if success:
+                os.replace(tmp_path, cached_rendition_path(cached, rendition))
+            else:
+                Path(tmp_path).unlink(missing_ok=True)
+        if not success:
+            return False
+    
+    for rendition in renditions:
+        path = cached_rendition_path(cached, rendition)
+        os.utime(path)  # Mark as recently used for eviction
+        if not deliver_cached_video(path, rendition_path(output_path, rendition), deterministic):
+            return False
+    return True
+
+
+# ---------------------------------------------------------------------------
+# Job result cache: finished videos keyed on everything that affects their bytes
+# ---------------------------------------------------------------------------
+
+JOB_CACHE_MAX_BYTES = 2 * 1024 ** 3  # Least recently used videos are evicted past this size
+
+
+@lru_cache(maxsize=None)
+def renderer_version() -> str:
+    """Version stamp covering the renderer's own code and the installed Manim"""
+    from importlib import metadata
+    
+    digest = hashlib.sha256()
+    for module in (SCENE_MODULE, RENDERER_DIR / "manim_generator.py"):
+        digest.update(module.read_bytes())
+    try:
+        digest.update(metadata.version("manim").encode())
+    except metadata.PackageNotFoundError:
+        pass
+    return digest.hexdigest()[:16]
+
+
+def job_fingerprint(json_data: Dict[str, Any], audio_path: Optional[str], **settings: Any) -> str:
+    """
+    Hash identifying a render job's output
+    
+    Combines the normalized script, the narration's content hash, the renderer
+    version and any render settings (quality, frame rate mode, ...).
+    """
+    has_audio = bool(audio_path) and os.path.exists(audio_path)
+    payload = {
+        'script': script_fingerprint(json_data),
+        'audio': file_sha256(audio_path) if has_audio else None,
+        'renderer': renderer_version(),
+        'settings': settings,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def job_cache_path(fingerprint: str) -> Path:
+    """Where the finished video for a job fingerprint is cached"""
+    return render_cache_dir("jobs") / f"{fingerprint}.mp4"
+
+
+def job_timeline_path(fingerprint: str) -> Path:
+    """Where the rendered timeline of a cached job is kept, for timing its captions"""
+    return job_cache_path(fingerprint).with_suffix('.timeline.json')
+
+
+def cached_job_captions(
+    fingerprint: str,
+    script_data: Dict[str, Any],
+    audio_path: Optional[str],
+    captions_prefix: Optional[Path],
+    caption_format: Optional[str],
+) -> bool:
+    """
+    Write captions for a cached job before it is delivered; False if they cannot be
+    
+    Without audio the captions follow the timeline cached with the video, so
+    jobs cached without one count as a miss.
+    """
+    if not caption_format:
+        return True
+    timeline = read_timeline(job_timeline_path(fingerprint))
+    has_audio = bool(audio_path) and os.path.exists(audio_path)
+    if timeline is None and not has_audio:
+        return False
+    write_captions(script_data, audio_path, captions_prefix, caption_format, timeline)
+    return True
+
+
+def deliver_cached_video(cached: Path, output_path: str, deterministic: bool = False) -> bool:
+    """Copy a cached video to the output, remuxing it for stdout and pipes"""
+    import shutil
+    
+    if is_stream_output(output_path):
+        return remux_video(str(cached), output_path, deterministic)
+    shutil.copyfile(cached, output_path)
+    if deterministic:
+        print(f"Content hash: sha256:{file_sha256(output_path)}")
+    return True
+
+
+def cached_job_output(
+    fingerprint: str,
+    output_path: str,
+    deterministic: bool = False,
+    thumbnails_prefix: Optional[Path] = None,
+    renditions: Tuple[str, ...] = (),
+) -> bool:
+    """Deliver a job's output (and thumbnails and renditions, when wanted) from the cache; False on a miss"""
+    cached = job_cache_path(fingerprint)
+    if not cached.exists():
+        return False
+    if thumbnails_prefix is not None and not copy_thumbnail_sheet(cached.with_suffix(''), thumbnails_prefix):
+        return False  # Cached by a job that did not capture thumbnails
+    print(f"Job cache hit: {cached.name}")
+    os.utime(cached)  # Mark as recently used for eviction
+    if not deliver_cached_video(cached, output_path, deterministic):
+        return False
+    return not renditions or deliver_renditions(cached, output_path, renditions, deterministic)
+
+
+def prune_job_cache(max_bytes: int = JOB_CACHE_MAX_BYTES):
+    """Evict least recently used cached videos until the cache fits max_bytes"""
+    entries = []
+    for path in render_cache_dir("jobs").glob("*.mp4"):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            path.unlink()
+            total -= size
+        except FileNotFoundError:
+            pass
+        for sidecar in (*thumbnail_files(path.with_suffix('')), path.with_suffix('.timeline.json')):
+            sidecar.unlink(missing_ok=True)
+
+
+def finalize_job(
+    generated_video: Path,
+    output_path: str,
+    audio_path: str = None,
+    deterministic: bool = False,
+    fingerprint: Optional[str] = None,
+    thumbnails_prefix: Optional[Path] = None,
+    subtitles_path: Optional[Path] = None,
+    renditions: Tuple[str, ...] = (),
+    timeline_path: Optional[Path] = None,
+) -> bool:
+    """
+    Finalize a rendered video, storing it in the job cache when a fingerprint is given
+    
+    The muxed video is written into the cache first and delivered from there,
+    so stdout and pipe outputs get cached too. Thumbnails already written to
+    thumbnails_prefix and the timeline at timeline_path are cached with it,
+    and renditions are encoded from the cached video and cached next to it.
+    """
+    import shutil
+    
+    if fingerprint is None:
+        if not finalize_video(generated_video, output_path, audio_path, deterministic, subtitles_path):
+            return False
+        return not renditions or encode_renditions(
+            output_path, {rendition: rendition_path(output_path, rendition) for rendition in renditions}, deterministic
+        )
+    
+    cached = job_cache_path(fingerprint)
+    tmp_cached = cached.with_name(f".{cached.stem}.{os.getpid()}.tmp.mp4")  # FFmpeg picks the muxer from the extension
+    if not finalize_video(generated_video, str(tmp_cached), audio_path, deterministic, subtitles_path):
+        tmp_cached.unlink(missing_ok=True)
+        return False
+    os.replace(tmp_cached, cached)
+    if thumbnails_prefix is not None:
+        copy_thumbnail_sheet(thumbnails_prefix, cached.with_suffix(''))
+    if timeline_path is not None and timeline_path.exists():
+        shutil.copyfile(timeline_path, job_timeline_path(fingerprint))
+    prune_job_cache()
+    if not deliver_cached_video(cached, output_path):
+        return False
+    return not renditions or deliver_renditions(cached, output_path, renditions, deterministic)
+
+
+def combine_audio_video(
+    video_path: str,
+    audio_path: str,
+    output_path: str,
+    deterministic: bool = False,
+    audio_codec: str = "aac",
+    subtitles_path: Optional[str] = None,
+) -> bool:
+    """
+    Combine video and audio using FFmpeg
+    
+    Args:
+        video_path: Path to video file
+        audio_path: Path to audio file
+        output_path: Path for combined output, "-" for stdout or a named pipe
+        deterministic: Strip timestamps/encoder tags and pin encoder threads
+        audio_codec: "copy" for audio already encoded by prepare_audio
+        subtitles_path: Caption file to mux as a soft subtitle stream in the same pass
+        
+    Returns:
+        bool: Success status
+    """
+    try:
+        length_args = ["-shortest"]
+        if subtitles_path:
+            # -shortest would also stop at the last caption, so cut at the shorter of video and audio
+            lengths = [length for length in (media_duration(video_path), media_duration(audio_path)) if length]
+            length_args = ["-t", f"{min(lengths):.3f}"] if lengths else []
+        
+        cmd = [
+            "ffmpeg",
+            "-i", video_path,
+            "-i", audio_path,
+            *(["-i", subtitles_path] if subtitles_path else []),
+            "-c:v", "copy",
+            "-c:a", audio_codec,
+            "-map", "0:v:0",
+            "-map", "1:a:0",
+            *(subtitle_stream_args(2) if subtitles_path else []),
+            *length_args,
+            *(DETERMINISTIC_FFMPEG_FLAGS if deterministic else []),
+            "-y",  # Overwrite output file
+            *ffmpeg_output_args(output_path),
+        ]
+        
+        print(f"Combining audio and video: {' '.join(cmd)}")
+        result = run_ffmpeg_to_output(cmd, output_path)
+        
+        if result.returncode != 0:
+            print(f"FFmpeg error: {result.stderr}")
+            return False
+            
+        print("Audio and video combined successfully")
+        return True
+        
+    except Exception as e:
+        print(f"Error combining audio and video: {e}")
+        return False
+
+
+def concat_videos(video_paths: List[Path], output_path: str) -> bool:
+    """
+    Stitch videos with identical encoding settings using FFmpeg's concat demuxer
+    
+    Args:
+        video_paths: Videos in playback order
+        output_path: Path for the stitched output
+        
+    Returns:
+        bool: Success status
+    """
+    try:
+        list_file = Path(output_path).with_suffix('.txt')
+        with open(list_file, 'w', encoding='utf-8') as f:
+            for video_path in video_paths:
+                f.write(f"file '{Path(video_path).resolve().as_posix()}'\n")
+        
+        cmd = [
+            "ffmpeg",
+            "-f", "concat",
+            "-safe", "0",
+            "-i", str(list_file),
+            "-c", "copy",
+            "-y",
+            output_path
+        ]
+        
+        print(f"Stitching {len(video_paths)} segments: {' '.join(cmd)}")
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        list_file.unlink()
+        
+        if result.returncode != 0:
+            print(f"FFmpeg concat error: {result.stderr}")
+            return False
+        return True
+        
+    except Exception as e:
+        print(f"Error stitching videos: {e}")
+        return False
+
+
+# ---------------------------------------------------------------------------
+# Host-wide render limit
+#
+# Every render holds one of N slot files locked for as long as it runs, and
+# renders waiting for a slot line up behind ticket files in a FIFO queue. OS
+# file locks are dropped when a process dies, so a crashed render never leaks
+# its slot or its place in the queue.
+# ---------------------------------------------------------------------------
+
+MAX_RENDERS_ENV = "BYTE_MAX_RENDERS"
+DEFAULT_MAX_QUEUE = 8  # Renders allowed to wait for a slot before new ones are rejected
+DEFAULT_QUEUE_TIMEOUT = 300.0  # Seconds a render waits for a slot
+DEFAULT_RENDER_MEMORY_MB = 0  # Available memory a render needs before it may start; off unless asked for
+SLOT_POLL_INTERVAL = 0.2
+TICKET_GRACE = 2.0  # Seconds a fresh ticket counts as live before its owner has locked it
+EXIT_BUSY = 75  # EX_TEMPFAIL: the caller should retry later
+
+
+class RenderBusy(Exception):
+    """No render slot became available within the queue limits"""
+
+
+def default_max_renders() -> int:
+    """Render slots per host from BYTE_MAX_RENDERS, or half the CPUs if it is unset or invalid"""
+    fallback = max(1, (os.cpu_count() or 2) // 2)
+    value = os.environ.get(MAX_RENDERS_ENV, '').strip()
+    if not value:
+        return fallback
+    try:
+        max_renders = int(value)
+    except ValueError:
+        max_renders = 0
+    if max_renders < 1:
+        print(f"Warning: ignoring {MAX_RENDERS_ENV}={value!r}, expected a positive integer; using {fallback}")
+        return fallback
+    return max_renders
+
+
+@dataclass(frozen=True)
+class RenderLimits:
+    """How many renders may run on this host at once, and how long others may wait"""
+    max_renders: int = field(default_factory=default_max_renders)
+    max_queue: int = DEFAULT_MAX_QUEUE
+    queue_timeout: float = DEFAULT_QUEUE_TIMEOUT  # 0 rejects immediately when busy
+    memory_mb: float = DEFAULT_RENDER_MEMORY_MB  # 0 disables the memory check
+
+
+def lock_file(path: Path):
+    """Open and exclusively lock a file without blocking; None if another process holds it"""
+    handle = open(path, 'a+b')
+    try:
+        if os.name == 'nt':
+            import msvcrt
+            msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return handle
+    except OSError:
+        handle.close()
+        return None
+
+
+def available_memory_mb() -> Optional[float]:
+    """MemAvailable from /proc/meminfo, None where it cannot be read"""
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def live_tickets(queue_dir: Path) -> List[Path]:
+    """Queue tickets of waiting renders, oldest first; tickets of dead processes are removed"""
+    import time
+    
+    live = []
+    for ticket in sorted(queue_dir.glob("*.ticket")):
+        if time.time() - int(ticket.stem.split('-')[0]) / 1e9 < TICKET_GRACE:
+            live.append(ticket)
+            continue
+        probe = lock_file(ticket)
+        if probe is None:
+            live.append(ticket)
+            continue
+        probe.close()
+        try:
+            ticket.unlink()
+        except OSError:
+            pass
+    return live
+
+
+@contextmanager
+def render_slot(limits: RenderLimits):
+    """
+    Hold one of this host's render slots for the duration of the block
+    
+    Raises:
+        RenderBusy: If the queue is already full, or no slot with enough free
+            memory opened up within limits.queue_timeout
+    """
+    import time
+    
+    slots_dir = render_cache_dir("slots")
+    queue_dir = render_cache_dir("queue")
+    
+    waiting = live_tickets(queue_dir)
+    if len(waiting) >= limits.max_queue:
+        raise RenderBusy(f"{len(waiting)} renders already queued")
+    
+    ticket_path = queue_dir / f"{time.time_ns():020d}-{os.getpid()}.ticket"
+    ticket = lock_file(ticket_path)
+    if ticket is None:
+        raise RenderBusy("Renderer busy: could not lock a queue ticket")
+    deadline = time.monotonic() + limits.queue_timeout
+    slot = None
+    reason = "all render slots are in use"
+    try:
+        # Renders checking the queue at the same time can all pass the check
+        # above; with the ticket in place, only the first max_queue stay
+        position = live_tickets(queue_dir).index(ticket_path)
+        if position >= limits.max_queue:
+            raise RenderBusy(f"{position} renders already queued")
+        
+        while slot is None:
+            # Only the head of the queue may take a slot, so waiting renders start in order
+            queue = live_tickets(queue_dir)
+            if queue and queue[0] == ticket_path:
+                for i in range(limits.max_renders):
+                    slot = lock_file(slots_dir / f"slot-{i}.lock")
+                    if slot is not None:
+                        break
+                free_mb = available_memory_mb()
+                if slot is not None and limits.memory_mb and free_mb is not None and free_mb < limits.memory_mb:
+                    slot.close()
+                    slot = None
+                    reason = f"only {free_mb:.0f} MB of memory available"
+            if slot is None:
+                if time.monotonic() >= deadline:
+                    raise RenderBusy(f"Renderer busy: {reason}")
+                time.sleep(SLOT_POLL_INTERVAL)
+    finally:
+        ticket.close()
+        try:
+            ticket_path.unlink()
+        except OSError:
+            pass
+    
+    try:
+        yield
+    finally:
+        slot.close()
+
+
+# ---------------------------------------------------------------------------
+# Profiling: on-demand profiles of the scene's construct() in the Manim child
+#
+#   <prefix>.profile.json   wall time per visual type (every mode)
+#   <prefix>.collapsed.txt  sampled stacks in the collapsed format flamegraph
+#                           tools and py-spy read (every mode)
+#   <prefix>.pstats         cProfile dump ("full" mode only)
+# ---------------------------------------------------------------------------
+
+PROFILE_ENV = "BYTE_PROFILE"  # Profile mode for the scene: "full" or "sample"
+PROFILE_PATH_ENV = "BYTE_PROFILE_PATH"  # Path prefix the scene writes its profile files to
+PROFILE_RATE_ENV = "BYTE_PROFILE_RATE"  # Default share of jobs profiled in sample mode
+PROFILE_MODES = ("full", "sample")
+PROFILE_SAMPLE_INTERVAL = 0.01  # Seconds between stack samples
+
+
+class JobProfiler:
+    """
+    Profile of one render
+    
+    "full" runs cProfile on top of the stack sampler. "sample" only walks the
+    rendering thread's stack every PROFILE_SAMPLE_INTERVAL from a background
+    thread, cheap enough to leave on for a share of production jobs. Time per
+    visual type is recorded in every mode, including when profiling is off.
+    """
+    
+    def __init__(self, mode: Optional[str] = None, interval: float = PROFILE_SAMPLE_INTERVAL):
+        self.mode = mode if mode in PROFILE_MODES else None
+        self.interval = interval
+        self.visual_times: Dict[str, List[float]] = {}  # label -> [count, seconds]
+        self.stacks: Dict[str, int] = {}
+        self.wall_seconds = 0.0
+        self._profile = None
+        self._sampler = None
+        self._stopped = None
+        self._started_at = 0.0
+    
+    @contextmanager
+    def measure(self, label: str):
+        """Add the block's wall time to a visual type's total"""
+        import time
+        
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry = self.visual_times.setdefault(label, [0, 0.0])
+            entry[0] += 1
+            entry[1] += time.perf_counter() - start
+    
+    def start(self):
+        """Start profiling the calling thread"""
+        import threading
+        import time
+        
+        self._started_at = time.perf_counter()
+        if not self.mode:
+            return
+        if self.mode == "full":
+            import cProfile
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        self._stopped = threading.Event()
+        self._sampler = threading.Thread(
+            target=self._sample_stacks, args=(threading.get_ident(),), name="stack-sampler", daemon=True
+        )
+        self._sampler.start()
+    
+    def stop(self):
+        """Stop profiling; safe to call when profiling never started"""
+        import time
+        
+        self.wall_seconds = time.perf_counter() - self._started_at
+        if self._profile is not None:
+            self._profile.disable()
+        if self._sampler is not None:
+            self._stopped.set()
+            self._sampler.join()
+            self._sampler = None
+    
+    def _sample_stacks(self, thread_id: int):
+        """Count the target thread's stacks, root first, in collapsed form"""
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if names:
+                stack = ";".join(reversed(names))
+                self.stacks[stack] = self.stacks.get(stack, 0) + 1
+    
+    def write(self, prefix: Path) -> List[Path]:
+        """Write this profile's files next to `prefix` and return their paths"""
+        prefix.parent.mkdir(parents=True, exist_ok=True)
+        written = []
+        
+        breakdown = {
+            'mode': self.mode,
+            'wall_seconds': round(self.wall_seconds, 3),
+            'samples': sum(self.stacks.values()),
+            'sample_interval': self.interval,
+            # Waits for narration sync and anything else outside a measured block
+            'unattributed_seconds': round(self.wall_seconds - sum(seconds for _, seconds in self.visual_times.values()), 3),
+            'visual_types': {
+                label: {
+                    'count': count,
+                    'seconds': round(seconds, 3),
+                    'share': round(seconds / self.wall_seconds, 4) if self.wall_seconds else 0,
+                }
+                for label, (count, seconds) in sorted(self.visual_times.items(), key=lambda item: -item[1][1])
+            },
+        }
+        path = Path(f"{prefix}.profile.json")
+        path.write_text(json.dumps(breakdown, indent=2), encoding='utf-8')
+        written.append(path)
+        
+        if self.mode:
+            path = Path(f"{prefix}.collapsed.txt")
+            with open(path, 'w', encoding='utf-8') as f:
+                for stack, count in sorted(self.stacks.items()):
+                    f.write(f"{stack} {count}\n")
+            written.append(path)
+        
+        if self._profile is not None:
+            path = Path(f"{prefix}.pstats")
+            self._profile.dump_stats(str(path))
+            written.append(path)
+        return written
+
+
+def sampled_profile_mode(rate: float) -> Optional[str]:
+    """"sample" for a `rate` share of calls, so a fraction of jobs get profiled"""
+    import random
+    
+    return "sample" if rate > 0 and random.random() < rate else None
+
+
+# ---------------------------------------------------------------------------
+# Thumbnails: frames captured by the scene while it renders, written as one
+# WebP sprite sheet plus a JSON index, so the UI never decodes the video
+#
+#   <prefix>.thumbs.webp   tiles left to right, top to bottom
+#   <prefix>.thumbs.json   tile size, columns, poster tile, and per tile its
+#                          timestamp, kind ("section" or "equation") and label
+# ---------------------------------------------------------------------------
+
+THUMBNAILS_PATH_ENV = "BYTE_THUMBNAILS_PATH"  # Path prefix the scene writes its sprite sheet to
+THUMBNAIL_WIDTH = 240  # Tile width in pixels; the height follows the frame's aspect ratio
+THUMBNAIL_COLUMNS = 10
+THUMBNAIL_QUALITY = 80  # WebP quality of the sprite sheet
+
+
+@dataclass(frozen=True)
+class Thumbnail:
+    """One captured frame, already scaled down to tile size"""
+    time: float  # Seconds into the render that captured it (farm segments are shifted when merged)
+    kind: str  # "section" or "equation"
+    label: str
+    image: Any  # PIL.Image.Image
+
+
+def thumbnail_tile(pixels: "np.ndarray") -> Any:
+    """Scale an RGBA frame down to a sprite sheet tile"""
+    from PIL import Image
+    
+    height, width = pixels.shape[:2]
+    tile_height = max(1, round(height * THUMBNAIL_WIDTH / width))
+    # Wrap the frame without copying it, box-reduce by a whole factor to about
+    # twice the tile size, and only then resample and drop alpha
+    image = Image.frombuffer("RGBA", (width, height), pixels, "raw", "RGBA", 0, 1)
+    image = image.reduce(max(1, width // (2 * THUMBNAIL_WIDTH)))
+    return image.resize((THUMBNAIL_WIDTH, tile_height), Image.BILINEAR).convert("RGB")
+
+
+def thumbnail_files(prefix: Path) -> Tuple[Path, Path]:
+    """Sprite sheet and index paths for a prefix"""
+    return Path(f"{prefix}.thumbs.webp"), Path(f"{prefix}.thumbs.json")
+
+
+def write_thumbnail_sheet(thumbnails: List[Thumbnail], prefix: Path) -> List[Path]:
+    """Lay thumbnails out in a sprite sheet and write it with its index"""
+    from PIL import Image
+    
+    if not thumbnails:
+        return []
+    sheet_path, index_path = thumbnail_files(prefix)
+    sheet_path.parent.mkdir(parents=True, exist_ok=True)
+    
+    tile_width, tile_height = thumbnails[0].image.size
+    columns = min(THUMBNAIL_COLUMNS, len(thumbnails))
+    rows = -(-len(thumbnails) // columns)
+    sheet = Image.new("RGB", (columns * tile_width, rows * tile_height))
+    frames = []
+    for i, thumbnail in enumerate(thumbnails):
+        x, y = (i % columns) * tile_width, (i // columns) * tile_height
+        sheet.paste(thumbnail.image, (x, y))
+        frames.append({'time': thumbnail.time, 'kind': thumbnail.kind, 'label': thumbnail.label, 'x': x, 'y': y})
+    sheet.save(sheet_path, "WEBP", quality=THUMBNAIL_QUALITY, method=4)
+    
+    # The poster is the first finished equation, or failing that the first section
+    kinds = [thumbnail.kind for thumbnail in thumbnails]
+    index = {
+        'sheet': sheet_path.name,
+        'tile_width': tile_width,
+        'tile_height': tile_height,
+        'columns': columns,
+        'poster': kinds.index("equation") if "equation" in kinds else 0,
+        'frames': frames,
+    }
+    index_path.write_text(json.dumps(index, indent=2, ensure_ascii=False), encoding='utf-8')
+    return [sheet_path, index_path]
+
+
+def read_thumbnail_sheet(prefix: Path) -> List[Thumbnail]:
+    """Thumbnails of a written sprite sheet, empty if there is none"""
+    from PIL import Image
+    
+    sheet_path, index_path = thumbnail_files(prefix)
+    if not index_path.exists():
+        return []
+    with open(index_path, 'r', encoding='utf-8') as f:
+        index = json.load(f)
+    with Image.open(sheet_path) as sheet:
+        sheet = sheet.convert("RGB")
+    width, height = index['tile_width'], index['tile_height']
+    return [
+        Thumbnail(frame['time'], frame['kind'], frame['label'],
+                  sheet.crop((frame['x'], frame['y'], frame['x'] + width, frame['y'] + height)))
+        for frame in index['frames']
+    ]
+
+
+def copy_thumbnail_sheet(source: Path, target: Path) -> bool:
+    """Copy a sprite sheet and its index to another prefix; False if the source has none"""
+    import shutil
+    
+    source_sheet, source_index = thumbnail_files(source)
+    target_sheet, target_index = thumbnail_files(target)
+    if not source_index.exists():
+        return False
+    shutil.copyfile(source_sheet, target_sheet)
+    with open(source_index, 'r', encoding='utf-8') as f:
+        index = json.load(f)
+    index['sheet'] = target_sheet.name
+    target_index.write_text(json.dumps(index, indent=2, ensure_ascii=False), encoding='utf-8')
+    return True
+
+
+# ---------------------------------------------------------------------------
+# Render farm: file-based task queue in a shared spool directory
+#
+#   spool/tasks/<job>-<n>.json   segment task (script slice + cost estimate)
+#   spool/locks/<job>-<n>.lock   worker claim, mtime refreshed as a heartbeat
+#   spool/results/<job>-<n>.mp4  rendered segment
+#   spool/done/<job>-<n>.json    completion marker with status
+#   spool/profiles/<job>-<n>.*   segment profile, when one was requested or sampled
+#   spool/thumbnails/<job>-<n>.* segment thumbnail sheet, when the job wants thumbnails
+#
+# Files are written to a temporary name and renamed into place, and claims use
+# O_CREAT|O_EXCL, so the queue also works on NFS shares.
+# ---------------------------------------------------------------------------
+
+FARM_LOCK_TIMEOUT = 600  # Seconds without a heartbeat before a claim is considered dead
+FARM_POLL_INTERVAL = 1.0
+FARM_DIRS = ("tasks", "locks", "results", "done", "profiles", "thumbnails", "timelines")
+
+
+def split_script_segments(script_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Split a script's timeline into independently renderable segments
+    
+    New-structure scripts become title + introduction, then one segment per
+    section, with the conclusion and final padding folded into the last one.
+    Sections without visuals join the previous segment so every segment plays
+    at least one animation. Legacy step scripts stay a single segment.
+    """
+    sections = script_data.get('sections', [])
+    if not sections:
+        return [{'title': True, 'introduction': True, 'sections': [0, 0],
+                 'conclusion': True, 'final': True, 'start_time': 0}]
+    
+    introduction = script_data.get('introduction', {})
+    segments = [{'title': True, 'introduction': True, 'sections': [0, 0], 'start_time': 0}]
+    
+    # Declared timeline, mirroring MathVideoScene.current_time bookkeeping
+    start_time = 4 + (introduction.get('duration', 30) if introduction else 0)
+    for i, section in enumerate(sections):
+        # Narration-synced sections start exactly where their audio does
+        start_time = section.get('audioStart', start_time)
+        if section.get('visualSequence') or len(segments) == 1:
+            if 'audioStart' in section:
+                # Hold the previous segment until this one takes over
+                segments[-1]['end_time'] = start_time
+            segments.append({'sections': [i, i + 1], 'start_time': start_time})
+        else:
+            segments[-1]['sections'][1] = i + 1
+        start_time += section.get('duration', 45)
+    
+    segments[-1].update(conclusion=True, final=True)
+    return segments
+
+
+def segment_cost(script_data: Dict[str, Any], segment: Dict[str, Any]) -> float:
+    """Estimated render seconds for one segment, used to schedule big tasks first"""
+    sections = script_data.get('sections')
+    if sections is None:
+        return estimate_script_cost(script_data)
+    first, last = segment.get('sections', [0, 0])
+    return estimate_script_cost({'sections': sections[first:last]}) + (4.0 if segment.get('title') else 0.0)
+
+
+def spool_dirs(spool: Path) -> Dict[str, Path]:
+    """Create (if needed) and return the spool's queue directories"""
+    dirs = {name: spool / name for name in FARM_DIRS}
+    for path in dirs.values():
+        path.mkdir(parents=True, exist_ok=True)
+    return dirs
+
+
+def write_atomic(path: Path, data: str):
+    """Write a file under a temporary name and rename it into place"""
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def break_stale_claim(lock_path: Path, lock_timeout: float):
+    """
+    Remove a lock file whose owner stopped refreshing it
     
-    def render_section(self, section: Dict[str, Any], section_index: int):
-        """Render section with synchronized visuals and timing - NO CLUTTERING"""
-        
-        section_title = section.get('title', f'Section {section_index + 1}')
-        duration = section.get('duration', 45)
-        visual_sequence = section.get('visualSequence', [])
-        
-        print(f"Rendering section: {section_title} (Duration: {duration}s)")
-        
-        # Clear any previous content at start of section
-        if section_index > 0 or self.current_time > 4:  # Don't clear after title
-            self.clear_scene()
-        
-        section_start_time = 0
-        
-        # Process each visual element with precise timing
-        for i, visual in enumerate(visual_sequence):
-            # Clear previous visual before showing new one to prevent overlap
-            if i > 0:
-                self.clear_scene()
-            
-            self.render_visual_element(visual, section_start_time)
-            
-        # Final wait to complete section duration
-        self.current_time += duration
+    Only the worker that creates the exclusive <lock>.breaking marker may break
+    the claim, and it checks the lock's age again while holding the marker: a
+    worker that saw the same dead claim a moment later finds the fresh lock
+    its winner created and leaves it alone.
+    """
+    import time
     
-    def render_visual_element(self, visual: Dict[str, Any], section_start: float):
-        """Render individual visual element with exact timing - CLEAN DISPLAY"""
-        
-        visual_type = visual.get('type', '')
-        content = visual.get('content', '')
-        timing = visual.get('timing', [0, 10])
-        start_time, end_time = timing
-        
-        # Calculate display duration
-        display_duration = min(end_time - start_time, 15)  # Cap at 15s to prevent too long displays
-        
-        if visual_type == "text_display":
-            self.show_text_display(content, display_duration)
-            
-        elif visual_type == "math_equation":
-            self.show_math_equation(content, display_duration)
-            
-        elif visual_type == "graph_plot":
-            self.show_graph_plot(content, display_duration)
-            
-        elif visual_type == "step_by_step":
-            self.show_step_by_step(content, display_duration)
-            
-        elif visual_type == "highlight_parts":
-            self.show_highlight_parts(content, display_duration)
-            
-        elif visual_type == "real_world_example":
-            self.show_real_world_example(content, display_duration)
-        else:
-            # Fallback for unknown types
-            self.show_text_display(content, display_duration)
+    marker_path = lock_path.with_name(f"{lock_path.name}.breaking")
+    try:
+        if time.time() - marker_path.stat().st_mtime > lock_timeout:
+            marker_path.unlink()  # Left by a worker that died mid-break
+    except FileNotFoundError:
+        pass
     
-    def show_text_display(self, content: str, duration: float):
-        """Display text with controlled timing - CLEAN LAYOUT"""
-        text_obj = Text(content, font_size=36, color=WHITE)
-        text_obj.move_to(ORIGIN)
-        self.add_to_scene(text_obj)
-        
-        animate_time = min(1.5, duration * 0.3)
-        hold_time = max(1, duration - animate_time)
-        
-        self.play(Write(text_obj), run_time=animate_time)
-        self.wait(hold_time)
+    try:
+        os.close(os.open(marker_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        return  # Another worker is breaking this claim
+    try:
+        if time.time() - lock_path.stat().st_mtime > lock_timeout:
+            lock_path.unlink()
+            print(f"Broke stale claim on {lock_path.stem}")
+    except FileNotFoundError:
+        pass
+    finally:
+        marker_path.unlink()
+
+
+def claim_task(lock_path: Path, worker_id: str, lock_timeout: float) -> bool:
+    """Try to claim a task by creating its lock file exclusively, breaking dead claims"""
+    import time
+    
+    try:
+        if time.time() - lock_path.stat().st_mtime > lock_timeout:
+            break_stale_claim(lock_path, lock_timeout)
+    except FileNotFoundError:
+        pass
     
-    def show_math_equation(self, content: str, duration: float):
-        """Display math equation with highlighting - CENTERED"""
+    try:
+        fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, 'w') as f:
+        f.write(worker_id)
+    return True
+
+
+def keep_claim_alive(lock_path: Path, stop, interval: float):
+    """Refresh a lock file's mtime until `stop` is set"""
+    while not stop.wait(interval):
         try:
-            cleaned_math = self.clean_latex(content)
-            math_obj = MathTex(cleaned_math, font_size=48, color=WHITE)
-            math_obj.move_to(ORIGIN)
-            self.add_to_scene(math_obj)
-            
-            animate_time = min(2, duration * 0.4)
-            hold_time = max(1, duration - animate_time - 1)
-            
-            self.play(Write(math_obj), run_time=animate_time)
-            if hold_time > 0:
-                self.wait(hold_time)
-            self.play(Indicate(math_obj, color=BLUE), run_time=1)
-            
-        except Exception as e:
-            print(f"Math rendering error: {e}")
-            fallback = Text(f"Equation: {content}", font_size=32, color=BLUE)
-            fallback.move_to(ORIGIN)
-            self.add_to_scene(fallback)
-            self.play(Write(fallback), run_time=duration * 0.5)
-            self.wait(duration * 0.5)
-    
-    def show_graph_plot(self, content: str, duration: float):
-        """Display coordinate system and function plot - FOCUSED"""
+            os.utime(lock_path)
+        except OSError:
+            return
+
+
+def pending_tasks(dirs: Dict[str, Path]) -> List[Tuple[float, Path]]:
+    """Tasks without a completion marker, most expensive first"""
+    pending = []
+    for task_path in dirs["tasks"].glob("*.json"):
+        if (dirs["done"] / task_path.name).exists():
+            continue
         try:
-            # Create clean, centered axes
-            axes = Axes(
-                x_range=[-4, 4, 1],
-                y_range=[-3, 3, 1],
-                x_length=8,
-                y_length=6,
-                axis_config={"color": BLUE, "stroke_width": 2},
-            )
-            axes.move_to(ORIGIN)
-            self.add_to_scene(axes)
-            
-            # Add minimal labels
-            labels = axes.get_axis_labels(x_label="x", y_label="y")
-            self.add_to_scene(labels)
-            
-            # Animate axes creation
-            axes_time = min(2, duration * 0.4)
-            self.play(Create(axes), Write(labels), run_time=axes_time)
-            
-            # Add function based on content
-            if "quadratic" in content.lower() or "parabola" in content.lower():
-                func = axes.plot(lambda x: 0.2 * x**2, color=YELLOW, x_range=[-3, 3])
-            elif "linear" in content.lower():
-                func = axes.plot(lambda x: 0.5 * x, color=GREEN, x_range=[-3, 3])
-            elif "sin" in content.lower():
-                func = axes.plot(lambda x: np.sin(x), color=RED, x_range=[-3, 3])
-            else:
-                func = axes.plot(lambda x: x, color=ORANGE, x_range=[-3, 3])
-            
-            self.add_to_scene(func)
-            func_time = min(2, duration * 0.4)
-            remaining_time = max(0.5, duration - axes_time - func_time)
-            
-            self.play(Create(func), run_time=func_time)
-            self.wait(remaining_time)
-                
-        except Exception as e:
-            print(f"Graph error: {e}")
-            fallback = Text("Graph visualization", font_size=32, color=YELLOW)
-            fallback.move_to(ORIGIN)
-            self.add_to_scene(fallback)
-            self.play(Write(fallback), run_time=duration)
-    
-    def show_step_by_step(self, content: str, duration: float):
-        """Show step-by-step breakdown - SEQUENTIAL"""
-        steps = content.split('|') if '|' in content else [content]
-        step_duration = max(2, duration / len(steps))
-        
-        for i, step in enumerate(steps):
-            # Clear previous step
-            if i > 0:
-                self.clear_scene()
-                
-            step_text = Text(f"Step {i+1}: {step.strip()}", font_size=28, color=WHITE)
-            step_text.move_to(ORIGIN)
-            self.add_to_scene(step_text)
-            
-            self.play(Write(step_text), run_time=min(1.5, step_duration * 0.5))
-            self.wait(max(0.5, step_duration - 1.5))
+            with open(task_path, 'r', encoding='utf-8') as f:
+                cost = json.load(f).get('cost', 0)
+        except (OSError, ValueError):
+            continue  # Removed by its coordinator in the meantime
+        pending.append((cost, task_path))
+    pending.sort(key=lambda item: (-item[0], item[1].name))
+    return pending
+
+
+def run_task(task_path: Path, dirs: Dict[str, Path], worker_id: str, profile_rate: float = 0) -> bool:
+    """Render one claimed segment task into the results directory"""
+    import shutil
     
-    def show_highlight_parts(self, content: str, duration: float):
-        """Highlight parts of equations or concepts - SELECTIVE"""
-        try:
-            # Create the main equation
-            main_eq = MathTex(self.clean_latex(content), font_size=44, color=WHITE)
-            main_eq.move_to(ORIGIN)
-            self.add_to_scene(main_eq)
-            
-            write_time = min(2, duration * 0.3)
-            self.play(Write(main_eq), run_time=write_time)
-            
-            # Highlight different parts if we have time
-            remaining_time = duration - write_time
-            if remaining_time > 2 and len(main_eq) > 1:
-                highlight_time = min(1, remaining_time / len(main_eq))
-                for part in main_eq[:3]:  # Limit to first 3 parts to avoid cluttering
-                    self.play(Indicate(part, color=YELLOW), run_time=highlight_time)
+    with open(task_path, 'r', encoding='utf-8') as f:
+        task = json.load(f)
+    
+    render = dict(task.get('render', {}))
+    render['profile'] = render.get('profile') or sampled_profile_mode(profile_rate)
+    if render['profile']:
+        render['profile_path'] = dirs["profiles"] / task_path.stem
+    if render.pop('thumbnails', False):
+        render['thumbnails_path'] = dirs["thumbnails"] / task_path.stem
+    render['timeline_path'] = dirs["timelines"] / f"{task_path.stem}.json"
+    
+    print(f"[{worker_id}] Rendering {task_path.stem} ({task['index'] + 1}/{task['count']})")
+    status = {'worker': worker_id, 'status': 'error'}
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            generated_video = render_scene_video(task['script'], Path(temp_dir), **render)
+            if generated_video is not None:
+                result_path = dirs["results"] / f"{task_path.stem}.mp4"
+                tmp_result = result_path.with_name(f".{result_path.name}.{os.getpid()}.tmp")
+                shutil.copyfile(generated_video, tmp_result)
+                os.replace(tmp_result, result_path)
+                status['status'] = 'ok'
             else:
-                self.wait(remaining_time)
-                    
-        except Exception as e:
-            print(f"Highlight error: {e}")
-            fallback = Text("Concept breakdown", font_size=32, color=YELLOW)
-            fallback.move_to(ORIGIN)
-            self.add_to_scene(fallback)
-            self.play(Write(fallback), run_time=duration)
-    
-    def show_real_world_example(self, content: str, duration: float):
-        """Show real-world application - CLEAR PRESENTATION"""
-        title_text = Text("Real-world application:", font_size=32, color=GREEN, weight=BOLD)
-        title_text.to_edge(UP, buff=1.5)
-        self.add_to_scene(title_text)
-        
-        content_text = Text(content, font_size=28, color=WHITE)
-        content_text.move_to(ORIGIN)
-        self.add_to_scene(content_text)
-        
-        title_time = min(1, duration * 0.3)
-        content_time = min(1.5, duration * 0.4)
-        wait_time = max(0.5, duration - title_time - content_time)
-        
-        self.play(Write(title_text), run_time=title_time)
-        self.play(Write(content_text), run_time=content_time)
-        self.wait(wait_time)
-    
-    def render_introduction(self):
-        """Render introduction section"""
-        intro = self.introduction
-        intro_text = intro.get('text', '')
-        duration = intro.get('duration', 30)
-        
-        if intro_text:
-            # Create centered introduction text
-            intro_obj = Text(intro_text, font_size=36, color=WHITE)
-            intro_obj.move_to(ORIGIN)
-            self.add_to_scene(intro_obj)
-            
-            self.play(Write(intro_obj), run_time=2)
-            self.wait(max(1, duration - 4))  # Account for write and fade time
-            
-        self.current_time += duration
+                status['error'] = 'Manim rendering failed'
+    except Exception as e:
+        status['error'] = str(e)
     
-    def render_conclusion(self):
-        """Render conclusion section"""
-        # Clear previous content
-        self.clear_scene()
-        
-        conclusion = self.conclusion
-        conclusion_text = conclusion.get('text', '')
-        duration = conclusion.get('duration', 20)
-        
-        if conclusion_text:
-            conclusion_obj = Text(conclusion_text, font_size=32, color=BLUE, weight=BOLD)
-            conclusion_obj.move_to(ORIGIN)
-            self.add_to_scene(conclusion_obj)
-            
-            self.play(Write(conclusion_obj), run_time=2)
-            self.wait(max(1, duration - 2))
-            
-        self.current_time += duration
-    
-    def clean_latex(self, latex_str: str) -> str:
-        """Clean LaTeX string for Manim compatibility"""
-        # Remove markdown math delimiters
-        latex_str = latex_str.replace('$$', '')
-        latex_str = latex_str.replace('$', '')
-        
-        # Remove double backslashes that might cause issues
-        latex_str = latex_str.replace('\\\\', '\\')
-        
-        # Common LaTeX fixes for Manim
-        latex_str = latex_str.replace('\\text{', '\\mathrm{')
-        latex_str = latex_str.replace('\\pm', '\\pm ')
-        
-        # Handle common math functions
-        latex_str = latex_str.replace('\\sin', '\\sin ')
-        latex_str = latex_str.replace('\\cos', '\\cos ')
-        latex_str = latex_str.replace('\\tan', '\\tan ')
-        latex_str = latex_str.replace('\\log', '\\log ')
-        latex_str = latex_str.replace('\\ln', '\\ln ')
-        
-        # Handle common symbols
-        latex_str = latex_str.replace('infinity', '\\infty')
-        latex_str = latex_str.replace('∞', '\\infty')
-        latex_str = latex_str.replace('±', '\\pm')
-        latex_str = latex_str.replace('≤', '\\leq')
-        latex_str = latex_str.replace('≥', '\\geq')
-        latex_str = latex_str.replace('≠', '\\neq')
-        latex_str = latex_str.replace('→', '\\to')
-        latex_str = latex_str.replace('∈', '\\in')
-        latex_str = latex_str.replace('∀', '\\forall')
-        latex_str = latex_str.replace('∃', '\\exists')
-        
-        # Clean up extra spaces
-        import re
-        latex_str = re.sub(r'\s+', ' ', latex_str).strip()
-        
-        return latex_str
+    write_atomic(dirs["done"] / task_path.name, json.dumps(status))
+    return status['status'] == 'ok'
 
 
-def setup_manim_environment():
-    """Setup proper environment for Manim with LaTeX"""
-    # Ensure MiKTeX is in PATH
-    miktex_path = os.path.expanduser(r"~\AppData\Local\Programs\MiKTeX\miktex\bin\x64")
-    if os.path.exists(miktex_path) and miktex_path not in os.environ['PATH']:
-        os.environ['PATH'] += os.pathsep + miktex_path
-        print(f"Added MiKTeX to PATH: {miktex_path}")
+def run_farm_worker(
+    spool: Path,
+    exit_when_idle: bool = False,
+    lock_timeout: float = FARM_LOCK_TIMEOUT,
+    poll_interval: float = FARM_POLL_INTERVAL,
+    limits: Optional[RenderLimits] = None,
+    profile_rate: float = 0,
+) -> int:
+    """
+    Claim and render segment tasks from a spool directory
     
-    # Create media directory if it doesn't exist
-    media_dir = Path("./media")
-    media_dir.mkdir(exist_ok=True)
+    Args:
+        spool: Shared spool directory
+        exit_when_idle: Return once no claimable tasks are left instead of polling forever
+        lock_timeout: Seconds without heartbeat after which another worker's claim is broken
+        poll_interval: Seconds between queue scans when idle
+        limits: Share this host's render slots with other renders (retried while busy)
+        profile_rate: Share of tasks to profile in sample mode when their job did not ask
+        
+    Returns:
+        int: Number of tasks rendered successfully
+    """
+    import socket
+    import threading
+    import time
     
-    return True
+    dirs = spool_dirs(spool)
+    worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    rendered = 0
+    print(f"Render farm worker {worker_id} watching {spool}")
+    
+    while True:
+        claimed = lock_path = None
+        try:
+            # Take a host render slot before claiming, so a claimed task never waits for one
+            with render_slot(limits) if limits and pending_tasks(dirs) else nullcontext():
+                for _, task_path in pending_tasks(dirs):
+                    candidate_lock = dirs["locks"] / f"{task_path.stem}.lock"
+                    if claim_task(candidate_lock, worker_id, lock_timeout):
+                        claimed, lock_path = task_path, candidate_lock
+                        break
+                
+                if claimed is not None:
+                    stop = threading.Event()
+                    heartbeat = threading.Thread(
+                        target=keep_claim_alive,
+                        args=(lock_path, stop, lock_timeout / 4),
+                        daemon=True,
+                    )
+                    heartbeat.start()
+                    try:
+                        if claimed.exists() and run_task(claimed, dirs, worker_id, profile_rate):
+                            rendered += 1
+                    finally:
+                        stop.set()
+                        heartbeat.join()
+        except RenderBusy as e:
+            print(f"[{worker_id}] {e}; retrying")
+            time.sleep(poll_interval)
+            continue
+        
+        if claimed is None:
+            if exit_when_idle:
+                return rendered
+            time.sleep(poll_interval)
 
 
-def generate_video_from_json(json_data: Dict[str, Any], output_path: str, audio_path: str = None) -> bool:
+def coordinate_render(
+    json_data: Dict[str, Any],
+    output_path: str,
+    audio_path: str = None,
+    spool: Path = None,
+    local_workers: int = 0,
+    timeout: float = 3600,
+    deterministic: bool = False,
+    quality: str = DEFAULT_QUALITY,
+    variable_frame_rate: bool = False,
+    raster_axes: bool = False,
+    sync_sections: bool = False,
+    use_cache: bool = True,
+    profile: Optional[str] = None,
+    thumbnails: bool = False,
+    captions: Optional[str] = None,
+    mux_captions: bool = False,
+    renditions: Tuple[str, ...] = (),
+) -> bool:
     """
-    Generate video from JSON script data
+    Render a script by fanning its segments out to render farm workers
     
     Args:
         json_data: Script data dictionary
-        output_path: Where to save the video
+        output_path: Where to save the stitched video, "-" for stdout or a named pipe
         audio_path: Optional audio file path
+        spool: Shared spool directory the workers watch
+        local_workers: Worker processes to start on this host as well
+        timeout: Seconds to wait for all segments before giving up
+        deterministic: Produce byte-identical output for identical inputs
+        quality: Key of QUALITY_PRESETS, applied by every worker
+        variable_frame_rate: Render holds as single frames (see render_scene_video)
+        raster_axes: Draw graph axes from a pre-rendered background image
+        sync_sections: Start each section when its narration starts in the audio
+        use_cache: Reuse a cached result for an identical job, and cache this one
+        profile: Profile every segment in one of PROFILE_MODES; the files are
+            collected next to the output
+        thumbnails: Capture thumbnails in every segment and merge them into one
+            sprite sheet next to the output
+        captions: Write a caption track in one of CAPTION_FORMATS next to the output
+        mux_captions: Also mux the captions as a soft subtitle stream
+        renditions: Keys of RENDITION_HEIGHTS to downscale the stitched output to as well
         
     Returns:
         bool: Success status
     """
+    import shutil
+    import time
+    import uuid
+    
+    thumbnails_prefix = sidecar_prefix(output_path, "thumbnails") if thumbnails else None
+    caption_format = captions or ("vtt" if mux_captions else None)
+    captions_prefix = sidecar_prefix(output_path, "captions") if caption_format else None
+    script_data = json_data
+    fingerprint = None
+    if use_cache:
+        # Stitched segments differ from a single render, so farm jobs get their own key
+        fingerprint = job_fingerprint(
+            json_data, audio_path,
+            farm=True,
+            mux_captions=mux_captions,
+            deterministic=deterministic,
+            quality=quality,
+            variable_frame_rate=variable_frame_rate,
+            raster_axes=raster_axes,
+            sync_sections=sync_sections,
+        )
+        if not profile and cached_job_captions(
+            fingerprint, script_data, audio_path, captions_prefix, caption_format
+        ) and cached_job_output(fingerprint, output_path, deterministic, thumbnails_prefix, renditions):
+            return True
+    
+    if sync_sections:
+        json_data = synced_script(json_data, audio_path)
+    
+    dirs = spool_dirs(spool)
+    job_id = uuid.uuid4().hex[:12]
+    segments = split_script_segments(json_data)
+    names = [f"{job_id}-{i:03d}" for i in range(len(segments))]
+    
+    for i, (name, segment) in enumerate(zip(names, segments)):
+        task = {
+            'job_id': job_id,
+            'index': i,
+            'count': len(segments),
+            'cost': segment_cost(json_data, segment),
+            'script': dict(json_data, segment=segment),
+            'render': {
+                'quality': quality,
+                'variable_frame_rate': variable_frame_rate,
+                'raster_axes': raster_axes,
+                'profile': profile,
+                'thumbnails': thumbnails,
+                'deterministic': deterministic,
+            },
+        }
+        write_atomic(dirs["tasks"] / f"{name}.json", json.dumps(task))
+    print(f"Queued job {job_id} as {len(segments)} segments in {spool}")
+    
+    workers = [
+        subprocess.Popen([
+            sys.executable, os.path.abspath(__file__), "worker",
+            "--spool", str(spool), "--exit-when-idle",
+        ], stdout=sys.stdout)  # Keeps worker logs off the video stream when writing to stdout
+        for _ in range(local_workers)
+    ]
+    
     try:
-        # Setup environment
-        setup_manim_environment()
+        deadline = time.monotonic() + timeout
+        while True:
+            markers = [dirs["done"] / f"{name}.json" for name in names]
+            finished = [marker for marker in markers if marker.exists()]
+            for marker in finished:
+                with open(marker, 'r', encoding='utf-8') as f:
+                    status = json.load(f)
+                if status.get('status') != 'ok':
+                    print(f"Segment {marker.stem} failed on {status.get('worker')}: {status.get('error')}")
+                    return False
+            if len(finished) == len(names):
+                break
+            if time.monotonic() > deadline:
+                print(f"Timed out waiting for {len(names) - len(finished)} segments")
+                return False
+            time.sleep(FARM_POLL_INTERVAL)
+        
+        segment_timelines = [read_timeline(dirs["timelines"] / f"{name}.json") for name in names]
+        timeline = merge_timelines(segment_timelines) if None not in segment_timelines else None
+        
+        if thumbnails_prefix is not None:
+            # Segment thumbnails are timed from their segment's start; shift them by
+            # the real length of the segments before it, not their declared start
+            offset = 0.0
+            thumbnails_merged = []
+            for name, segment_timeline in zip(names, segment_timelines):
+                thumbnails_merged += [
+                    replace(thumbnail, time=round(thumbnail.time + offset, 3))
+                    for thumbnail in read_thumbnail_sheet(dirs["thumbnails"] / name)
+                ]
+                if segment_timeline is not None:
+                    offset += segment_timeline['duration']
+                else:
+                    offset += media_duration(str(dirs["results"] / f"{name}.mp4")) or 0.0
+            write_thumbnail_sheet(thumbnails_merged, thumbnails_prefix)
         
-        # Create temporary directory
         with tempfile.TemporaryDirectory() as temp_dir:
-            temp_path = Path(temp_dir)
-            
-            # Create scene file
-            scene_file = temp_path / "generated_scene.py"
-            
-            # Generate Python scene code
-            scene_code = generate_scene_code(json_data)
-            
-            with open(scene_file, 'w', encoding='utf-8') as f:
-                f.write(scene_code)
-            
-            # Run Manim to generate video
-            cmd = [
-                "manim",
-                "-ql",  # Low quality for faster rendering (removed -p to prevent auto-opening)
-                "--disable_caching",  # Disable caching to prevent file locks
-                str(scene_file),
-                "MathVideoScene"
-            ]
-            
-            print(f"Running Manim command: {' '.join(cmd)}")
-            result = subprocess.run(cmd, capture_output=True, text=True, cwd=temp_dir)
-            
-            if result.returncode != 0:
-                print(f"Manim error: {result.stderr}")
-                return False
-            
-            print("Manim rendering completed successfully")
-            
-            # Find generated video
-            media_dir = temp_path / "media" / "videos" / "generated_scene" / "480p15"
-            video_files = list(media_dir.glob("*.mp4"))
-            
-            if not video_files:
-                print("No video file generated")
+            stitched = Path(temp_dir) / "stitched.mp4"
+            results = [dirs["results"] / f"{name}.mp4" for name in names]
+            if not concat_videos(results, str(stitched)):
                 return False
             
-            generated_video = video_files[0]
-            print(f"Found generated video: {generated_video}")
-            
-            # Wait a moment to ensure file is released
-            import time
-            time.sleep(2)
+            timeline_path = Path(temp_dir) / "timeline.json"
+            if timeline is not None:
+                write_timeline(timeline_path, timeline['starts'], timeline['duration'])
+            captions_path = None
+            if caption_format:
+                captions_path = write_captions(script_data, audio_path, captions_prefix, caption_format, timeline)
+            return finalize_job(
+                stitched, output_path, audio_path, deterministic, fingerprint, thumbnails_prefix,
+                subtitles_path=captions_path if mux_captions else None,
+                renditions=renditions,
+                timeline_path=timeline_path,
+            )
             
-            # If audio is provided, combine audio and video
-            if audio_path and os.path.exists(audio_path):
-                print("Combining video with audio...")
-                final_output = combine_audio_video(str(generated_video), audio_path, output_path)
-                return final_output
-            else:
-                # Just copy the video
-                print("Copying video without audio...")
-                import shutil
-                shutil.copy2(generated_video, output_path)
-                return True
-                
-    except Exception as e:
-        print(f"Error generating video: {e}")
-        return False
+    finally:
+        for worker in workers:
+            if worker.poll() is None:
+                worker.terminate()
+            worker.wait()
+        # Segment profiles, asked for by the job or sampled by a worker, move next to the output
+        profiles_prefix = sidecar_prefix(output_path, "profiles")
+        for i, name in enumerate(names):
+            for path in dirs["profiles"].glob(f"{name}.*"):
+                shutil.move(str(path), f"{profiles_prefix}.segment{i:03d}{path.name[len(name):]}")
+        for name in names:
+            for path in (
+                dirs["tasks"] / f"{name}.json",
+                dirs["locks"] / f"{name}.lock",
+                dirs["results"] / f"{name}.mp4",
+                dirs["done"] / f"{name}.json",
+                *thumbnail_files(dirs["thumbnails"] / name),
+                dirs["timelines"] / f"{name}.json",
+            ):
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+
+
+def count_batch_jobs(manifest_path: Path) -> int:
+    """Number of jobs in a JSONL manifest, counted without parsing them"""
+    with open(manifest_path, 'rb') as f:
+        return sum(1 for line in f if line.strip())
 
 
-def generate_scene_code(json_data: Dict[str, Any]) -> str:
-    """Generate Python code for Manim scene - SIMPLIFIED APPROACH"""
+def iter_batch_manifest(manifest_path: Path) -> Iterator[Optional[Dict[str, Any]]]:
+    """
+    Jobs from a JSONL manifest, parsed one line at a time as they are scheduled
     
-    # Use the new structure approach - delegate to class-based scene
-    code = f'''#!/usr/bin/env python3
-import json
-import sys
-import os
+    Paths are resolved against the manifest's directory. Lines that are not a
+    valid job are reported and yielded as None, so one bad line fails that
+    job instead of the rest of the batch.
+    """
+    base = manifest_path.resolve().parent
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                job = json.loads(line)
+                if not job.get('json') or not job.get('output'):
+                    raise ValueError('"json" and "output" are required')
+            except (ValueError, AttributeError) as e:
+                print(f"{manifest_path}:{line_number}: invalid job: {e}")
+                yield None
+                continue
+            for key in ('json', 'output', 'audio'):
+                if job.get(key):
+                    job[key] = str(base / job[key])
+            yield job
 
-# Add current directory to path for imports
-sys.path.append(os.path.dirname(__file__))
-
-from manim import *
-import numpy as np
-
-# Configure Manim for better LaTeX handling
-config.tex_template = TexTemplate()
-config.tex_template.add_to_preamble(r"\\usepackage{{amsmath}}")
-config.tex_template.add_to_preamble(r"\\usepackage{{amssymb}}")
-config.tex_template.add_to_preamble(r"\\usepackage{{amsfonts}}")
-
-# Script data
-script_data = {json.dumps(json_data, indent=2)}
-
-class MathVideoScene(Scene):
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        self.script_data = script_data
-        self.title = script_data.get('title', 'MathVideo')
-        
-        # Handle both old and new JSON structures
-        if 'sections' in script_data:
-            # New structure
-            self.total_duration = script_data.get('totalDuration', 300)
-            self.introduction = script_data.get('introduction', {{}})
-            self.sections = script_data.get('sections', [])
-            self.conclusion = script_data.get('conclusion', {{}})
-            self.use_new_structure = True
-        else:
-            # Old structure for backward compatibility
-            self.steps = script_data.get('steps', [])
-            self.total_duration = script_data.get('duration', 300)
-            self.use_new_structure = False
-            
-        self.current_time = 0
-        self.active_mobjects = []  # Track objects to prevent cluttering
-    
-    def construct(self):
-        """Main scene construction with perfect timing synchronization"""
-        
-        # Create and show title briefly
-        title_text = self.title.replace('_', ' ').replace('  ', ' ')
-        title = Text(title_text, font_size=44, color=BLUE, weight=BOLD)
-        title.move_to(ORIGIN)
-        
-        self.play(Write(title), run_time=2)
-        self.wait(1)
-        self.play(FadeOut(title), run_time=1)
-        self.current_time += 4
-        
-        if self.use_new_structure:
-            # New structure: Introduction → Sections → Conclusion
-            if self.introduction:
-                self.render_introduction()
-            
-            for i, section in enumerate(self.sections):
-                self.render_section(section, i)
-                
-            if self.conclusion:
-                self.render_conclusion()
-        else:
-            # Old structure: Steps
-            self.render_legacy_steps()
-            
-        # Final pause to reach exact duration
-        remaining_time = max(0, self.total_duration - self.current_time)
-        if remaining_time > 0:
-            self.wait(remaining_time)
-    
-    def clear_scene(self):
-        """Clear active objects to prevent cluttering"""
-        if self.active_mobjects:
-            self.play(*[FadeOut(mob) for mob in self.active_mobjects], run_time=0.5)
-            self.active_mobjects.clear()
-    
-    def add_to_scene(self, mobject):
-        """Add object to scene and track it"""
-        self.active_mobjects.append(mobject)
-        return mobject
-    
-    def render_introduction(self):
-        """Render introduction section"""
-        intro = self.introduction
-        intro_text = intro.get('text', '')
-        duration = intro.get('duration', 30)
-        
-        if intro_text:
-            intro_obj = Text(intro_text, font_size=36, color=WHITE)
-            intro_obj.move_to(ORIGIN)
-            self.add_to_scene(intro_obj)
-            
-            self.play(Write(intro_obj), run_time=2)
-            self.wait(max(1, duration - 4))
-            
-        self.current_time += duration
+
+def run_batch(manifest_path: Path, render_args: List[str], parallel: Optional[int] = None) -> bool:
+    """
+    Render every job in a JSONL manifest through child render processes
     
-    def render_section(self, section, section_index):
-        """Render section with synchronized visuals"""
-        
-        section_title = section.get('title', f'Section {{section_index + 1}}')
-        duration = section.get('duration', 45)
-        visual_sequence = section.get('visualSequence', [])
-        
-        print(f"Rendering section: {{section_title}} (Duration: {{duration}}s)")
-        
-        # Clear any previous content at start of section
-        if section_index > 0 or self.current_time > 4:
-            self.clear_scene()
-        
-        # Process each visual element
-        for i, visual in enumerate(visual_sequence):
-            # Clear previous visual before showing new one
-            if i > 0:
-                self.clear_scene()
-            
-            self.render_visual_element(visual)
-            
-        self.current_time += duration
+    Each manifest line is {"json": ..., "output": ..., "audio": ...}. Up to
+    `parallel` children run at once and each still takes a host render slot,
+    so batch jobs queue alongside renders started by the API instead of
+    competing with them. Children rejected as busy are retried.
     
-    def render_visual_element(self, visual):
-        """Render individual visual element"""
-        
-        visual_type = visual.get('type', '')
-        content = visual.get('content', '')
-        timing = visual.get('timing', [0, 10])
-        start_time, end_time = timing
-        
-        display_duration = min(end_time - start_time, 15)
-        
-        if visual_type == "text_display":
-            self.show_text_display(content, display_duration)
-            
-        elif visual_type == "math_equation":
-            self.show_math_equation(content, display_duration)
-            
-        elif visual_type == "graph_plot":
-            self.show_graph_plot(content, display_duration)
-            
-        elif visual_type == "step_by_step":
-            self.show_step_by_step(content, display_duration)
-            
-        elif visual_type == "highlight_parts":
-            self.show_highlight_parts(content, display_duration)
-            
-        elif visual_type == "real_world_example":
-            self.show_real_world_example(content, display_duration)
-        else:
-            self.show_text_display(content, display_duration)
+    The manifest is streamed: only the jobs that are running or waiting to be
+    retried are held in memory, so backfills of any size use the same memory.
     
-    def show_text_display(self, content, duration):
-        """Display text cleanly"""
-        text_obj = Text(content, font_size=36, color=WHITE)
-        text_obj.move_to(ORIGIN)
-        self.add_to_scene(text_obj)
-        
-        animate_time = min(1.5, duration * 0.3)
-        hold_time = max(1, duration - animate_time)
+    Args:
+        manifest_path: JSONL manifest of jobs
+        render_args: Extra command line arguments for every child render
+        parallel: Child processes to keep running at once (default_max_renders() if None)
         
-        self.play(Write(text_obj), run_time=animate_time)
-        self.wait(hold_time)
+    Returns:
+        bool: Whether every job succeeded
+    """
+    import time
+    from collections import deque
     
-    def show_math_equation(self, content, duration):
-        """Display math equation"""
-        try:
-            cleaned_math = self.clean_latex(content)
-            math_obj = MathTex(cleaned_math, font_size=48, color=WHITE)
-            math_obj.move_to(ORIGIN)
-            self.add_to_scene(math_obj)
-            
-            animate_time = min(2, duration * 0.4)
-            hold_time = max(1, duration - animate_time - 1)
-            
-            self.play(Write(math_obj), run_time=animate_time)
-            if hold_time > 0:
-                self.wait(hold_time)
-            self.play(Indicate(math_obj, color=BLUE), run_time=1)
-            
-        except Exception as e:
-            print(f"Math rendering error: {{e}}")
-            fallback = Text(f"Equation: {{content}}", font_size=32, color=BLUE)
-            fallback.move_to(ORIGIN)
-            self.add_to_scene(fallback)
-            self.play(Write(fallback), run_time=duration * 0.5)
-            self.wait(duration * 0.5)
-    
-    def show_graph_plot(self, content, duration):
-        """Display graph"""
-        try:
-            axes = Axes(
-                x_range=[-4, 4, 1],
-                y_range=[-3, 3, 1],
-                x_length=8,
-                y_length=6,
-                axis_config={{"color": BLUE, "stroke_width": 2}},
-            )
-            axes.move_to(ORIGIN)
-            self.add_to_scene(axes)
-            
-            labels = axes.get_axis_labels(x_label="x", y_label="y")
-            self.add_to_scene(labels)
-            
-            axes_time = min(2, duration * 0.4)
-            self.play(Create(axes), Write(labels), run_time=axes_time)
-            
-            # Add function based on content
-            if "quadratic" in content.lower() or "parabola" in content.lower():
-                func = axes.plot(lambda x: 0.2 * x**2, color=YELLOW, x_range=[-3, 3])
-            elif "linear" in content.lower():
-                func = axes.plot(lambda x: 0.5 * x, color=GREEN, x_range=[-3, 3])
-            elif "sin" in content.lower():
-                func = axes.plot(lambda x: np.sin(x), color=RED, x_range=[-3, 3])
-            else:
-                func = axes.plot(lambda x: x, color=ORANGE, x_range=[-3, 3])
-            
-            self.add_to_scene(func)
-            func_time = min(2, duration * 0.4)
-            remaining_time = max(0.5, duration - axes_time - func_time)
-            
-            self.play(Create(func), run_time=func_time)
-            self.wait(remaining_time)
-                
-        except Exception as e:
-            print(f"Graph error: {{e}}")
-            fallback = Text("Graph visualization", font_size=32, color=YELLOW)
-            fallback.move_to(ORIGIN)
-            self.add_to_scene(fallback)
-            self.play(Write(fallback), run_time=duration)
-    
-    def show_step_by_step(self, content, duration):
-        """Show steps sequentially"""
-        steps = content.split('|') if '|' in content else [content]
-        step_duration = max(2, duration / len(steps))
-        
-        for i, step in enumerate(steps):
-            if i > 0:
-                self.clear_scene()
-                
-            step_text = Text(f"Step {{i+1}}: {{step.strip()}}", font_size=28, color=WHITE)
-            step_text.move_to(ORIGIN)
-            self.add_to_scene(step_text)
-            
-            self.play(Write(step_text), run_time=min(1.5, step_duration * 0.5))
-            self.wait(max(0.5, step_duration - 1.5))
+    parallel = parallel or default_max_renders()
+    total = count_batch_jobs(manifest_path)
+    jobs = enumerate(iter_batch_manifest(manifest_path))
+    retries = deque()  # Jobs rejected as busy, never more than `parallel`
+    running: Dict[int, Tuple[Dict[str, Any], subprocess.Popen]] = {}
+    failed = 0
+    print(f"Batch of {total} jobs from {manifest_path}, {parallel} at a time")
     
-    def show_highlight_parts(self, content, duration):
-        """Highlight equation parts"""
-        try:
-            main_eq = MathTex(self.clean_latex(content), font_size=44, color=WHITE)
-            main_eq.move_to(ORIGIN)
-            self.add_to_scene(main_eq)
-            
-            write_time = min(2, duration * 0.3)
-            self.play(Write(main_eq), run_time=write_time)
-            
-            remaining_time = duration - write_time
-            if remaining_time > 2 and len(main_eq) > 1:
-                highlight_time = min(1, remaining_time / len(main_eq))
-                for part in main_eq[:3]:
-                    self.play(Indicate(part, color=YELLOW), run_time=highlight_time)
+    while True:
+        while len(running) < parallel:
+            # Rejected jobs go back to the front of the line
+            entry = retries.popleft() if retries else next(jobs, None)
+            if entry is None:
+                break
+            index, job = entry
+            if job is None:
+                failed += 1
+                continue
+            cmd = [
+                sys.executable, os.path.abspath(__file__), "render",
+                "--json", job['json'], "--output", job['output'],
+                *(["--audio", job['audio']] if job.get('audio') else []),
+                *render_args,
+            ]
+            running[index] = (job, subprocess.Popen(cmd, stdout=sys.stdout))
+        
+        if not running:
+            break
+        time.sleep(SLOT_POLL_INTERVAL)
+        for index, (job, process) in list(running.items()):
+            code = process.poll()
+            if code is None:
+                continue
+            del running[index]
+            if code == EXIT_BUSY:
+                retries.append((index, job))
+            elif code == 0:
+                print(f"[batch {index + 1}/{total}] done: {job['output']}")
             else:
-                self.wait(remaining_time)
-                    
-        except Exception as e:
-            print(f"Highlight error: {{e}}")
-            fallback = Text("Concept breakdown", font_size=32, color=YELLOW)
-            fallback.move_to(ORIGIN)
-            self.add_to_scene(fallback)
-            self.play(Write(fallback), run_time=duration)
-    
-    def show_real_world_example(self, content, duration):
-        """Show real-world application"""
-        title_text = Text("Real-world application:", font_size=32, color=GREEN, weight=BOLD)
-        title_text.to_edge(UP, buff=1.5)
-        self.add_to_scene(title_text)
-        
-        content_text = Text(content, font_size=28, color=WHITE)
-        content_text.move_to(ORIGIN)
-        self.add_to_scene(content_text)
-        
-        title_time = min(1, duration * 0.3)
-        content_time = min(1.5, duration * 0.4)
-        wait_time = max(0.5, duration - title_time - content_time)
-        
-        self.play(Write(title_text), run_time=title_time)
-        self.play(Write(content_text), run_time=content_time)
-        self.wait(wait_time)
-    
-    def render_conclusion(self):
-        """Render conclusion"""
-        self.clear_scene()
-        
-        conclusion = self.conclusion
-        conclusion_text = conclusion.get('text', '')
-        duration = conclusion.get('duration', 20)
-        
-        if conclusion_text:
-            conclusion_obj = Text(conclusion_text, font_size=32, color=BLUE, weight=BOLD)
-            conclusion_obj.move_to(ORIGIN)
-            self.add_to_scene(conclusion_obj)
-            
-            self.play(Write(conclusion_obj), run_time=2)
-            self.wait(max(1, duration - 2))
-            
-        self.current_time += duration
-    
-    def render_legacy_steps(self):
-        """Render old-style steps"""
-        for i, step in enumerate(self.steps):
-            text_content = step.get('text', '')
-            math_content = step.get('math', '')
-            step_duration = step.get('duration', 20)
-            
-            if i > 0:
-                self.clear_scene()
-            
-            if text_content:
-                text_obj = Text(text_content, font_size=32, color=WHITE)
-                text_obj.to_edge(UP, buff=1)
-                self.add_to_scene(text_obj)
-                self.play(Write(text_obj), run_time=1.5)
-            
-            if math_content:
-                try:
-                    cleaned_math = self.clean_latex(math_content)
-                    math_obj = MathTex(cleaned_math, font_size=44, color=WHITE)
-                    math_obj.move_to(ORIGIN)
-                    self.add_to_scene(math_obj)
-                    self.play(Write(math_obj), run_time=2)
-                    self.play(Indicate(math_obj, color=BLUE), run_time=1)
-                except Exception as e:
-                    print(f"Math error: {{e}}")
-                    fallback = Text(f"Math: {{math_content}}", font_size=28, color=BLUE)
-                    fallback.move_to(ORIGIN)
-                    self.add_to_scene(fallback)
-                    self.play(Write(fallback), run_time=1.5)
-            
-            used_time = 4.5 if text_content and math_content else 3 if text_content or math_content else 1
-            remaining = max(0.5, step_duration - used_time)
-            self.wait(remaining)
-            self.current_time += step_duration
+                failed += 1
+                print(f"[batch {index + 1}/{total}] failed ({code}): {job['json']}")
+    
+    print(f"Batch finished: {total - failed}/{total} jobs succeeded")
+    return failed == 0
+
+
+# ---------------------------------------------------------------------------
+# Self-test
+#
+# Health check for render nodes: confirms the toolchain is installed and times
+# the steps every render goes through, so a degraded node (e.g. a TeX install
+# that rebuilds its format files on every run) is caught before it takes jobs.
+# ---------------------------------------------------------------------------
+
+SELFTEST_TOOLS = {  # Command printing each tool's version
+    'manim': ["manim", "--version"],
+    'latex': ["latex", "--version"],
+    'dvisvgm': ["dvisvgm", "--version"],
+    'ffmpeg': ["ffmpeg", "-version"],
+}
+SELFTEST_EXPRESSION = r"\frac{-b \pm \sqrt{b^2 - 4ac}}{2a}"
+SELFTEST_PREFLIGHT = (  # Valid LaTeX the preflight must pass on to latex
+    r"a \not= b",
+    r"x \not\in A",
+    r"\mathop{x}",
+    r"a \lneq b \gneqq c",
+    r"\nleq \ngeq",
+    r"\left( \frac{1}{2} \right)",
+)
+SELFTEST_BUDGETS = {  # Seconds a check may take before the node counts as degraded
+    'manim': 15.0,
+    'latex': 5.0,
+    'dvisvgm': 5.0,
+    'ffmpeg': 5.0,
+    'manim_import': 10.0,
+    'mathtex_cold': 10.0,
+    'mathtex_warm': 1.0,
+    'render_1s': 30.0,
+    'mux': 5.0,
+}
+
+
+def selftest_check(checks: Dict[str, Dict[str, Any]], name: str, step: Callable[[], Any]):
+    """Run one self-test step, recording its status, duration and result"""
+    import time
+    
+    start = time.perf_counter()
+    try:
+        detail = step()
+        status = 'ok'
+    except Exception as e:
+        detail = f"{type(e).__name__}: {e}"
+        status = 'failed'
+    seconds = time.perf_counter() - start
+    
+    budget = SELFTEST_BUDGETS.get(name)
+    if status == 'ok' and budget is not None and seconds > budget:
+        status = 'slow'
+    checks[name] = {'status': status, 'seconds': round(seconds, 3), 'budget': budget, 'detail': str(detail or "")}
+    print(f"selftest {name}: {status} in {seconds:.2f}s")
+
+
+def tool_version(cmd: List[str]) -> str:
+    """First line a tool prints for its version, raising if it is missing or fails"""
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    return (result.stdout or result.stderr).strip().splitlines()[0]
+
+
+def selftest_render(work_dir: Path) -> Path:
+    """Render one second of a MathTex being written, returning the video"""
+    configure_manim()
+    from manim import MathTex, Scene, Write, tempconfig
+    
+    class SelftestScene(Scene):
+        def construct(self):
+            self.play(Write(MathTex(SELFTEST_EXPRESSION)), run_time=1)
     
-    def clean_latex(self, latex_str):
-        """Clean LaTeX for Manim"""
-        latex_str = latex_str.replace('$$', '').replace('$', '')
-        latex_str = latex_str.replace('\\\\\\\\', '\\\\')
-        latex_str = latex_str.replace('\\\\text{{', '\\\\mathrm{{')
-        latex_str = latex_str.replace('\\\\pm', '\\\\pm ')
-        return latex_str.strip()
-'''
+    with tempconfig({"media_dir": str(work_dir / "render"), "quality": "low_quality", "disable_caching": True}):
+        scene = SelftestScene()
+        scene.render()
+        return Path(scene.renderer.file_writer.movie_file_path)
+
+
+def silent_wav(path: Path, seconds: float = 1.0, sample_rate: int = 22050) -> Path:
+    """Write a silent mono WAV file"""
+    import wave
     
-    return code
+    with wave.open(str(path), 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(bytes(2 * int(seconds * sample_rate)))
+    return path
 
 
-def combine_audio_video(video_path: str, audio_path: str, output_path: str) -> bool:
+def run_selftest() -> Dict[str, Any]:
     """
-    Combine video and audio using FFmpeg
+    Check the renderer's toolchain and time its steps
+    
+    Times each tool's version command, checks that the LaTeX preflight passes
+    valid expressions and that overlapping highlights are dropped, and times a
+    MathTex compiled in an empty TeX
+    directory (cold: LaTeX, dvisvgm and SVG parsing) and again from the files
+    it left behind (warm, as in a new render process), a one-second render and
+    a mux with audio. Everything runs in a temporary directory.
     
-    Args:
-        video_path: Path to video file
-        audio_path: Path to audio file
-        output_path: Path for combined output
-        
     Returns:
-        bool: Success status
+        Report with an overall "ok" and per-check status ("ok", "slow" past its
+        budget in SELFTEST_BUDGETS, or "failed"), seconds and detail
     """
-    try:
-        # Wait to ensure video file is completely written
-        import time
-        time.sleep(1)
+    import platform
+    
+    checks: Dict[str, Dict[str, Any]] = {}
+    for name, cmd in SELFTEST_TOOLS.items():
+        selftest_check(checks, name, lambda cmd=cmd: tool_version(cmd))
+    
+    def preflight() -> str:
+        results = [preflight_latex(clean_latex(latex)) for latex in SELFTEST_PREFLIGHT]
+        flagged = [check.latex for check in results if not check.ok or check.problems or check.warnings]
+        if flagged:
+            raise RuntimeError(f"valid LaTeX flagged: {flagged}")
+        return f"{len(SELFTEST_PREFLIGHT)} expressions"
+    
+    selftest_check(checks, 'latex_preflight', preflight)
+    
+    def highlight() -> str:
+        # Nested highlights would pulse the wrong glyphs, so only the outer one may be kept
+        kept = isolatable_substrings("a x^2 + b x + c", ["c", "+ c", "x^2"])
+        if kept != ["+ c", "x^2"]:
+            raise RuntimeError(f"overlapping highlights kept: {kept}")
+        return ", ".join(kept)
+    
+    selftest_check(checks, 'highlight_parts', highlight)
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        work_dir = Path(temp_dir)
         
-        cmd = [
-            "ffmpeg",
-            "-i", video_path,
-            "-i", audio_path,
-            "-c:v", "copy",
-            "-c:a", "aac",
-            "-map", "0:v:0",
-            "-map", "1:a:0",
-            "-shortest",
-            "-y",  # Overwrite output file
-            output_path
-        ]
+        def mathtex(warm: bool) -> str:
+            from manim import MathTex, tempconfig
+            from manim.mobject.svg import svg_mobject
+            
+            if warm:
+                # Parse the cached SVG again instead of copying the in-memory result
+                svg_mobject.SVG_HASH_TO_MOB_MAP.clear()
+            with tempconfig({"media_dir": str(work_dir / "tex")}):
+                return f"{len(MathTex(SELFTEST_EXPRESSION).submobjects[0])} glyphs"
         
-        print(f"Combining audio and video: {' '.join(cmd)}")
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        # Imported on its own so the MathTex timings leave out Manim's import time
+        selftest_check(checks, 'manim_import', configure_manim)
+        selftest_check(checks, 'mathtex_cold', lambda: mathtex(warm=False))
+        selftest_check(checks, 'mathtex_warm', lambda: mathtex(warm=True))
         
-        if result.returncode != 0:
-            print(f"FFmpeg error: {result.stderr}")
-            # Try without audio mapping if it fails
-            print("Trying without audio mapping...")
-            simple_cmd = [
-                "ffmpeg",
-                "-i", video_path,
-                "-i", audio_path,
-                "-c:v", "copy",
-                "-c:a", "aac",
-                "-shortest",
-                "-y",
-                output_path
-            ]
-            result = subprocess.run(simple_cmd, capture_output=True, text=True)
-            if result.returncode != 0:
-                print(f"FFmpeg simple command also failed: {result.stderr}")
-                return False
-            
-        print("Audio and video combined successfully")
-        return True
+        rendered: List[Path] = []
         
-    except Exception as e:
-        print(f"Error combining audio and video: {e}")
-        return False
+        def render() -> str:
+            rendered.append(selftest_render(work_dir))
+            return rendered[0].name
+        
+        def mux() -> str:
+            if not rendered:
+                raise RuntimeError("no video, the render check failed")
+            output = work_dir / "mux.mp4"
+            if not combine_audio_video(str(rendered[0]), str(silent_wav(work_dir / "silence.wav")), str(output)):
+                raise RuntimeError("FFmpeg failed to mux")
+            return f"{output.stat().st_size} bytes"
+        
+        selftest_check(checks, 'render_1s', render)
+        selftest_check(checks, 'mux', mux)
+    
+    return {
+        'ok': all(check['status'] == 'ok' for check in checks.values()),
+        'host': platform.node(),
+        'renderer': renderer_version(),
+        'checks': checks,
+    }
 
 
 def test_latex_rendering():
     """Test function to check if LaTeX is rendering properly"""
+    configure_manim()
+    from manim import MathTex
+    
     try:
         # Test basic LaTeX expressions
         test_expressions = [
@@ -955,7 +3133,7 @@ def test_latex_rendering():
         
         for expr in test_expressions:
             try:
-                math_obj = MathTex(expr)
+                MathTex(expr)
                 print(f"✅ LaTeX '{expr}' rendered successfully")
             except Exception as e:
                 print(f"❌ LaTeX '{expr}' failed: {e}")
@@ -968,22 +3146,166 @@ def test_latex_rendering():
 
 def main():
     """Main function for command line usage"""
-    # Setup environment first
-    setup_manim_environment()
-    
+    max_renders = default_max_renders()
     parser = argparse.ArgumentParser(description='Generate Manim video from JSON script')
-    parser.add_argument('--json', required=True, help='Path to JSON script file')
-    parser.add_argument('--output', required=True, help='Output video path')
+    parser.add_argument('command', nargs='?', default='render', choices=['render', 'coordinate', 'worker', 'batch', 'selftest'],
+                        help='render locally (default), coordinate a render farm job, run a farm worker, '
+                             'render a batch manifest, or check the toolchain and print a JSON report')
+    parser.add_argument('--json', help='Path to JSON script file')
+    parser.add_argument('--output', help='Output video path, "-" to stream a fragmented mp4 to stdout')
     parser.add_argument('--audio', help='Optional audio file path')
+    parser.add_argument('--spool', help='Shared spool directory for coordinate/worker modes')
+    parser.add_argument('--local-workers', type=int, default=0,
+                        help='Farm workers to start on this host when coordinating')
+    parser.add_argument('--farm-timeout', type=float, default=3600,
+                        help='Seconds the coordinator waits for all segments')
+    parser.add_argument('--lock-timeout', type=float, default=FARM_LOCK_TIMEOUT,
+                        help='Seconds without heartbeat before a worker claim is considered dead')
+    parser.add_argument('--exit-when-idle', action='store_true',
+                        help='Stop the worker once no claimable tasks are left')
+    parser.add_argument('--deterministic', action='store_true',
+                        help='Produce byte-identical output for identical script and audio')
+    parser.add_argument('--quality', choices=list(QUALITY_PRESETS), default=DEFAULT_QUALITY,
+                        help='Manim quality preset (resolution and frame rate)')
+    parser.add_argument('--variable-frame-rate', action='store_true',
+                        help='Render waits as single frames and duplicate them when combining')
+    parser.add_argument('--raster-axes', action='store_true',
+                        help='Draw graph axes from a pre-rendered background image instead of vectors')
+    parser.add_argument('--sync-sections', action='store_true',
+                        help='Start each section when its narration starts, found from pauses in --audio')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Always render, bypassing the job result cache')
+    parser.add_argument('--manifest', help='JSONL batch manifest of {"json", "output", "audio"} jobs')
+    parser.add_argument('--parallel', type=int, default=max_renders,
+                        help='Child renders a batch keeps running at once')
+    parser.add_argument('--max-renders', type=int, default=max_renders,
+                        help=f'Renders allowed to run on this host at once (default from {MAX_RENDERS_ENV} or half the CPUs)')
+    parser.add_argument('--max-queue', type=int, default=DEFAULT_MAX_QUEUE,
+                        help='Renders allowed to wait for a slot before new ones are rejected as busy')
+    parser.add_argument('--queue-timeout', type=float, default=DEFAULT_QUEUE_TIMEOUT,
+                        help='Seconds to wait for a render slot (0 rejects immediately when busy)')
+    parser.add_argument('--memory-per-render', type=float, default=DEFAULT_RENDER_MEMORY_MB,
+                        help='MB of available memory required to start a render (default 0, no check)')
+    parser.add_argument('--thumbnails', action='store_true',
+                        help='Capture a thumbnail sprite sheet (.thumbs.webp) and index (.thumbs.json) while rendering')
+    parser.add_argument('--captions', choices=CAPTION_FORMATS,
+                        help='Write a caption track from the section narration next to the output')
+    parser.add_argument('--mux-captions', action='store_true',
+                        help='Also embed the captions as a soft subtitle stream (WebVTT unless --captions is given)')
+    parser.add_argument('--renditions', nargs='+', choices=list(RENDITION_HEIGHTS), default=[],
+                        help='Also write downscaled copies next to the output (e.g. test.480p.mp4)')
+    parser.add_argument('--profile', nargs='?', const='full', choices=PROFILE_MODES,
+                        help='Profile the render next to the output: "full" (cProfile, default) or "sample"')
+    parser.add_argument('--profile-rate', type=float, default=float(os.environ.get(PROFILE_RATE_ENV) or 0),
+                        help=f'Share of jobs (or worker tasks) to profile in sample mode (default from {PROFILE_RATE_ENV})')
     
     args = parser.parse_args()
     
+    if args.command in ('coordinate', 'worker') and not args.spool:
+        parser.error(f"{args.command} requires --spool")
+    
+    if args.command == 'batch' and not args.manifest:
+        parser.error("batch requires --manifest")
+    
+    if args.command in ('render', 'coordinate') and (not args.json or not args.output):
+        parser.error(f"{args.command} requires --json and --output")
+    
+    if args.renditions:
+        if args.output and is_stream_output(args.output):
+            parser.error("--renditions needs a file --output to write the renditions next to")
+        too_large = [rendition for rendition in args.renditions if RENDITION_HEIGHTS[rendition] >= preset_height(args.quality)]
+        if too_large:
+            parser.error(f"renditions {', '.join(too_large)} are not smaller than --quality {args.quality}")
+    
+    if args.output == STDOUT_OUTPUT or args.command == 'selftest':
+        # stdout carries the video (or the report), so logs go to stderr
+        sys.stdout = sys.stderr
+    
+    # Setup environment once the arguments are known to be usable
+    setup_manim_environment()
+    
+    limits = RenderLimits(args.max_renders, args.max_queue, args.queue_timeout, args.memory_per_render)
+    
+    if args.command == 'selftest':
+        report = run_selftest()
+        print(json.dumps(report, indent=2), file=sys.__stdout__)
+        sys.exit(0 if report['ok'] else 1)
+    
+    if args.command == 'worker':
+        run_farm_worker(
+            Path(args.spool),
+            exit_when_idle=args.exit_when_idle,
+            lock_timeout=args.lock_timeout,
+            limits=limits,
+            profile_rate=args.profile_rate,
+        )
+        sys.exit(0)
+    
+    if args.command == 'batch':
+        render_args = [
+            "--quality", args.quality,
+            "--max-renders", str(args.max_renders),
+            "--max-queue", str(args.max_queue),
+            "--queue-timeout", "inf",  # Batch jobs are never in a hurry
+            "--memory-per-render", str(args.memory_per_render),
+            "--profile-rate", str(args.profile_rate),
+        ]
+        if args.profile:
+            render_args += ["--profile", args.profile]
+        if args.captions:
+            render_args += ["--captions", args.captions]
+        if args.renditions:
+            render_args += ["--renditions", *args.renditions]
+        for flag in ('deterministic', 'variable_frame_rate', 'raster_axes', 'sync_sections', 'no_cache', 'thumbnails', 'mux_captions'):
+            if getattr(args, flag):
+                render_args.append("--" + flag.replace('_', '-'))
+        sys.exit(0 if run_batch(Path(args.manifest), render_args, args.parallel) else 1)
+    
     # Load JSON data
     with open(args.json, 'r', encoding='utf-8') as f:
         json_data = json.load(f)
     
+    profile = args.profile or sampled_profile_mode(args.profile_rate)
+    
     # Generate video
-    success = generate_video_from_json(json_data, args.output, args.audio)
+    if args.command == 'coordinate':
+        success = coordinate_render(
+            json_data, args.output, args.audio,
+            spool=Path(args.spool),
+            local_workers=args.local_workers,
+            timeout=args.farm_timeout,
+            deterministic=args.deterministic,
+            quality=args.quality,
+            variable_frame_rate=args.variable_frame_rate,
+            raster_axes=args.raster_axes,
+            sync_sections=args.sync_sections,
+            use_cache=not args.no_cache,
+            profile=profile,
+            thumbnails=args.thumbnails,
+            captions=args.captions,
+            mux_captions=args.mux_captions,
+            renditions=tuple(args.renditions),
+        )
+    else:
+        try:
+            success = generate_video_from_json(
+                json_data, args.output, args.audio,
+                deterministic=args.deterministic,
+                quality=args.quality,
+                variable_frame_rate=args.variable_frame_rate,
+                raster_axes=args.raster_axes,
+                sync_sections=args.sync_sections,
+                use_cache=not args.no_cache,
+                limits=limits,
+                profile=profile,
+                thumbnails=args.thumbnails,
+                captions=args.captions,
+                mux_captions=args.mux_captions,
+                renditions=tuple(args.renditions),
+            )
+        except RenderBusy as e:
+            print(str(e))
+            sys.exit(EXIT_BUSY)
     
     if success:
         print("Video generated successfully: " + args.output)
@@ -0,0 +1,582 @@
+#!/usr/bin/env python3
+"""
+Math Video Scene
+Stable Manim scene module rendered by the child process. The job script is
+read from the JSON file named by BYTE_SCRIPT_PATH rather than templated into
+generated source, so this module is compiled once and reused from its cached
+bytecode.
+"""
+
+import hashlib
+import json
+import os
+import random
+import subprocess
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+from manim import *
+from manim.renderer.cairo_renderer import CairoRenderer
+from manim.scene.scene_file_writer import SceneFileWriter
+from manim.utils.family import extract_mobject_family_members
+from manim.utils.file_ops import is_png_format, is_webm_format, write_to_movie
+
+from manim_generator import (
+    DETERMINISTIC_ENV,
+    DETERMINISTIC_FFMPEG_FLAGS,
+    PROFILE_ENV,
+    PROFILE_PATH_ENV,
+    SCRIPT_PATH_ENV,
+    THUMBNAILS_PATH_ENV,
+    TIMELINE_PATH_ENV,
+    VARIABLE_FRAME_RATE_ENV,
+    JobProfiler,
+    Thumbnail,
+    VisualPlan,
+    checked_latex,
+    clean_latex,
+    configure_manim,
+    fitted_text,
+    get_visual_renderer,
+    thumbnail_tile,
+    visual_display_duration,
+    write_thumbnail_sheet,
+    write_timeline,
+)
+
+configure_manim()
+
+CLEAR_FADE_TIME = 0.5  # Seconds clear_scene takes to fade out the previous visuals
+
+# Fixed seeds keep any randomized drawing reproducible between renders
+random.seed(0)
+np.random.seed(0)
+
+
+def load_job_script() -> Dict[str, Any]:
+    """Load the script this render was started for"""
+    script_path = os.environ.get(SCRIPT_PATH_ENV)
+    if not script_path:
+        raise RuntimeError(f"{SCRIPT_PATH_ENV} is not set; render through manim_generator.py")
+    with open(script_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+# ---------------------------------------------------------------------------
+# Frame output: the camera's pixel array is the memory Cairo draws into, and
+# frames go from it to FFmpeg's stdin without being copied on the way
+# ---------------------------------------------------------------------------
+
+def encoder_flags() -> List[str]:
+    """Extra FFmpeg output flags for the scene's x264 encodes"""
+    return DETERMINISTIC_FFMPEG_FLAGS if os.environ.get(DETERMINISTIC_ENV) == "1" else []
+
+
+class PipeFrameFileWriter(SceneFileWriter):
+    """Scene file writer that pipes frames to FFmpeg from their own buffer"""
+    
+    def open_movie_pipe(self, file_path=None):
+        if not encoder_flags() or is_webm_format() or config.transparent:
+            return super().open_movie_pipe(file_path)
+        
+        # Manim's x264 partial movie command, with the deterministic flags and
+        # without its version comment
+        if file_path is None:
+            file_path = self.partial_movie_files[self.renderer.num_plays]
+        self.partial_movie_file_path = file_path
+        
+        fps = config.frame_rate
+        if fps == int(fps):
+            fps = int(fps)
+        command = [
+            config.ffmpeg_executable,
+            "-y",
+            "-f", "rawvideo",
+            "-s", f"{config.pixel_width}x{config.pixel_height}",
+            "-pix_fmt", "rgba",
+            "-r", str(fps),
+            "-i", "-",
+            "-an",
+            "-loglevel", config.ffmpeg_loglevel.lower(),
+            "-vcodec", "libx264",
+            "-pix_fmt", "yuv420p",
+            *encoder_flags(),
+            str(file_path),
+        ]
+        self.writing_process = subprocess.Popen(command, stdin=subprocess.PIPE)
+    
+    def write_frame(self, frame_or_renderer):
+        frame = frame_or_renderer
+        if (isinstance(frame, np.ndarray) and frame.flags.c_contiguous
+                and write_to_movie() and not is_png_format()):
+            # A memoryview instead of frame.tobytes(): frames this large skip
+            # the pipe's write buffer, so the pixels are only copied by the kernel
+            self.writing_process.stdin.write(memoryview(frame).cast("B"))
+        else:
+            super().write_frame(frame_or_renderer)
+
+
+class DirectFrameRenderer(CairoRenderer):
+    """Cairo renderer that writes the camera's pixel array instead of a snapshot of it"""
+    
+    # Writes to the pipe finish before the next frame is drawn, so the live
+    # array can be handed over; get_frame() still returns a copy for callers
+    # that keep frames around
+    
+    def render(self, scene, time, moving_mobjects):
+        self.update_frame(scene, moving_mobjects)
+        self.add_frame(self.camera.pixel_array)
+    
+    def freeze_current_frame(self, duration: float):
+        dt = 1 / self.camera.frame_rate
+        self.add_frame(self.camera.pixel_array, num_frames=int(duration / dt))
+
+
+# ---------------------------------------------------------------------------
+# Static layer: mobjects that are not animating are rasterized once into a
+# background frame, and each frame starts from a copy of it
+#
+# Manim's Cairo renderer already draws only the moving mobjects over a static
+# image, but rebuilds that image for every play() and wait() and renders the
+# whole scene again on top of it for a wait. The classes below keep the raster
+# while the static mobjects are unchanged and skip the redundant redraws.
+# ---------------------------------------------------------------------------
+
+# Mobject attributes that decide how it rasterizes
+LAYER_ATTRIBUTES = (
+    "points", "fill_rgbas", "stroke_rgbas", "background_stroke_rgbas",
+    "stroke_width", "background_stroke_width", "sheen_factor", "z_index", "pixel_array",
+)
+
+
+def static_layer_key(mobjects) -> bytes:
+    """Digest of everything that affects how a list of mobjects is drawn"""
+    digest = hashlib.blake2b(digest_size=16)
+    for mobject in extract_mobject_family_members(mobjects, only_those_with_points=True):
+        digest.update(f"{id(mobject)}:{type(mobject).__name__}".encode())
+        for name in LAYER_ATTRIBUTES:
+            value = getattr(mobject, name, None)
+            if isinstance(value, np.ndarray):
+                digest.update(np.ascontiguousarray(value).data)
+            elif value is not None:
+                digest.update(repr(value).encode())
+    return digest.digest()
+
+
+class StaticLayerCamera(Camera):
+    """Camera that resets each frame to the static layer with a single in-place copy"""
+    
+    def set_frame_to_background(self, background):
+        if self.pixel_array.shape == background.shape and self.pixel_array.dtype == background.dtype:
+            # In place, so the cached Cairo context for this array stays valid
+            np.copyto(self.pixel_array, background)
+        else:
+            super().set_frame_to_background(background)
+
+
+class StaticLayerRenderer(DirectFrameRenderer):
+    """Cairo renderer that keeps the static layer between animations while it is unchanged"""
+    
+    static_key: Optional[bytes] = None
+    static_buffer: Optional[np.ndarray] = None  # Reused for every static layer of the scene
+    
+    def save_static_frame_data(self, scene, static_mobjects):
+        if not static_mobjects:
+            self.static_image = self.static_key = None
+            return None
+        key = static_layer_key(static_mobjects)
+        if self.static_image is None or key != self.static_key:
+            self.static_image = None
+            self.update_frame(scene, mobjects=static_mobjects)
+            pixels = self.camera.pixel_array
+            if self.static_buffer is None or self.static_buffer.shape != pixels.shape:
+                self.static_buffer = np.empty_like(pixels)
+            np.copyto(self.static_buffer, pixels)
+            self.static_image = self.static_buffer
+            self.static_key = key
+        return self.static_image
+    
+    def update_frame(self, scene, mobjects=None, include_submobjects=True, ignore_skipping=True, **kwargs):
+        # Manim treats an empty list as "draw everything"; with a static layer
+        # that already holds everything (a wait), the layer alone is the frame
+        if mobjects is not None and len(mobjects) == 0 and self.static_image is not None:
+            if not (self.skip_animations and not ignore_skipping):
+                self.camera.set_frame_to_background(self.static_image)
+            return
+        super().update_frame(scene, mobjects, include_submobjects, ignore_skipping, **kwargs)
+
+
+# ---------------------------------------------------------------------------
+# Variable frame rate: holds are written as one frame and stretched at combine
+# ---------------------------------------------------------------------------
+
+class HoldFrameFileWriter(PipeFrameFileWriter):
+    """
+    Scene file writer that combines single-frame holds into a constant-rate movie
+    
+    Partial movie files for frozen waits contain one frame. Their real length is
+    recorded in hold_durations and handed to FFmpeg's concat demuxer, and the fps
+    filter duplicates the held frame back to the scene's frame rate.
+    """
+    
+    def __init__(self, renderer, scene_name, **kwargs):
+        super().__init__(renderer, scene_name, **kwargs)
+        self.hold_durations: Dict[str, float] = {}
+    
+    def hold_current_partial_movie(self, duration: float):
+        """Mark the partial movie file being written as a hold of `duration` seconds"""
+        self.hold_durations[self.partial_movie_file_path] = duration
+    
+    def combine_files(self, input_files, output_file, create_gif=False, includes_sound=False):
+        if create_gif or config.transparent or not self.hold_durations:
+            return super().combine_files(input_files, output_file, create_gif, includes_sound)
+        
+        fps = config.frame_rate
+        trailing_hold = 0.0
+        file_list = self.partial_movie_directory / "partial_movie_file_list.txt"
+        with file_list.open("w", encoding="utf-8") as fp:
+            fp.write("# This file is used internally by FFMPEG.\n")
+            for pf_path in input_files:
+                fp.write(f"file 'file:{Path(pf_path).as_posix()}'\n")
+                hold = self.hold_durations.get(str(pf_path))
+                if hold:
+                    fp.write(f"duration {hold:.6f}\n")
+                trailing_hold = hold or 0.0
+        
+        # The fps filter fills the gaps before each following frame; a hold at
+        # the very end has no following frame, so pad it explicitly
+        video_filter = f"fps={fps}"
+        if trailing_hold > 1 / fps:
+            video_filter += f",tpad=stop_mode=clone:stop_duration={trailing_hold - 1 / fps:.6f}"
+        
+        commands = [
+            config.ffmpeg_executable,
+            "-y",
+            "-f", "concat",
+            "-safe", "0",
+            "-i", str(file_list),
+            "-loglevel", config.ffmpeg_loglevel.lower(),
+            "-nostdin",
+            "-vf", video_filter,
+            "-vcodec", "libx264",
+            "-pix_fmt", "yuv420p",
+            *encoder_flags(),
+        ]
+        if not includes_sound:
+            commands += ["-an"]
+        commands += [str(output_file)]
+        subprocess.run(commands)
+
+
+class HoldFrameRenderer(StaticLayerRenderer):
+    """Cairo renderer that writes frozen waits as a single frame instead of one per tick"""
+    
+    def freeze_current_frame(self, duration: float):
+        if self.skip_animations:
+            return
+        dt = 1 / self.camera.frame_rate
+        num_frames = int(duration / dt)
+        if num_frames == 0:
+            return
+        self.time += num_frames * dt
+        self.file_writer.write_frame(self.camera.pixel_array)
+        self.file_writer.hold_current_partial_movie(num_frames * dt)
+
+
+class MathVideoScene(Scene):
+    def __init__(self, script_data: Optional[Dict[str, Any]] = None, **kwargs):
+        if kwargs.get('renderer') is None:
+            variable_frame_rate = os.environ.get(VARIABLE_FRAME_RATE_ENV) == "1"
+            renderer_class = HoldFrameRenderer if variable_frame_rate else StaticLayerRenderer
+            kwargs['renderer'] = renderer_class(
+                file_writer_class=HoldFrameFileWriter if variable_frame_rate else PipeFrameFileWriter,
+                camera_class=kwargs.get('camera_class', StaticLayerCamera),
+                skip_animations=kwargs.get('skip_animations', False),
+            )
+        super().__init__(**kwargs)
+        if script_data is None:
+            script_data = load_job_script()
+        self.script_data = script_data
+        self.title = script_data.get('title', 'MathVideo')
+        
+        # Handle both old and new JSON structures
+        if 'sections' in script_data:
+            # New structure
+            self.total_duration = script_data.get('totalDuration', 300)
+            self.introduction = script_data.get('introduction', {})
+            self.sections = script_data.get('sections', [])
+            self.conclusion = script_data.get('conclusion', {})
+            self.use_new_structure = True
+        else:
+            # Old structure for backward compatibility
+            self.steps = script_data.get('steps', [])
+            self.total_duration = script_data.get('duration', 300)
+            self.use_new_structure = False
+            
+        self.segment = script_data.get('segment')  # Set when rendering one render farm task
+        self.current_time = 0
+        self.active_mobjects = []  # Track objects to prevent cluttering
+        self.profiler = JobProfiler(os.environ.get(PROFILE_ENV))
+        self.thumbnails_path = os.environ.get(THUMBNAILS_PATH_ENV)
+        self.thumbnails: List[Thumbnail] = []
+        self.pending_section: Optional[str] = None  # Section whose first drawn frame is still to be captured
+        self.timeline_path = os.environ.get(TIMELINE_PATH_ENV)
+        self.part_starts: Dict[str, float] = {}  # Narrated part -> second of this render it started at
+    
+    def construct(self):
+        """Render the job's timeline, profiled when the job asked for it"""
+        self.profiler.start()
+        try:
+            self.construct_timeline()
+        finally:
+            self.profiler.stop()
+            if self.profiler.mode:
+                for path in self.profiler.write(Path(os.environ[PROFILE_PATH_ENV])):
+                    print(f"Profile written: {path}")
+        
+        if self.thumbnails_path:
+            write_thumbnail_sheet(self.thumbnails, Path(self.thumbnails_path))
+        if self.timeline_path:
+            write_timeline(Path(self.timeline_path), self.part_starts, self.renderer.time)
+    
+    def construct_timeline(self):
+        """Main scene construction with perfect timing synchronization"""
+        
+        # A render farm segment only draws its own slice of the timeline
+        if self.segment:
+            self.current_time = self.segment.get('start_time', 0)
+        
+        if self.in_segment('title'):
+            with self.profiler.measure("title"):
+                # Create and show title briefly
+                title_text = self.title.replace('_', ' ').replace('  ', ' ')
+                title = Text(title_text, font_size=44, color=BLUE, weight=BOLD)
+                title.move_to(ORIGIN)
+                
+                self.play(Write(title), run_time=2)
+                self.wait(1)
+                self.play(FadeOut(title), run_time=1)
+            self.current_time += 4
+        
+        if self.use_new_structure:
+            # New structure: Introduction → Sections → Conclusion
+            if self.introduction and self.in_segment('introduction'):
+                with self.profiler.measure("introduction"):
+                    self.render_introduction()
+            
+            first, last = self.segment_sections()
+            for i in range(first, last):
+                self.render_section(self.sections[i], i)
+                
+            if self.conclusion and self.in_segment('conclusion'):
+                self.render_conclusion()
+        else:
+            # Old structure: Steps
+            with self.profiler.measure("legacy_steps"):
+                self.render_legacy_steps()
+            
+        if self.in_segment('final'):
+            # Final pause to reach exact duration
+            remaining_time = max(0, self.total_duration - self.current_time)
+            if remaining_time > 0:
+                self.wait(remaining_time)
+            # Never end before narration-synced audio does
+            self.wait_until(self.script_data.get('audioDuration'))
+        else:
+            # Fade out here, the next segment starts from an empty scene
+            self.wait_until(self.segment.get('end_time'), lead=CLEAR_FADE_TIME)
+            self.clear_scene()
+    
+    def in_segment(self, part: str) -> bool:
+        """Whether this render covers a timeline part (always true outside the render farm)"""
+        return not self.segment or bool(self.segment.get(part))
+    
+    def segment_sections(self) -> Tuple[int, int]:
+        """Half-open range of section indexes this render covers"""
+        if not self.segment:
+            return 0, len(self.sections)
+        first, last = self.segment.get('sections', [0, 0])
+        return first, last
+    
+    def timeline_time(self) -> float:
+        """Seconds into the final video, including the segment offset of farm renders"""
+        offset = self.segment.get('start_time', 0) if self.segment else 0
+        return offset + self.renderer.time
+    
+    def wait_until(self, timestamp: Optional[float], lead: float = 0):
+        """Hold the current frame until `lead` seconds before `timestamp` (no-op if None or already past)"""
+        if timestamp is None:
+            return
+        gap = timestamp - lead - self.timeline_time()
+        if gap >= 1 / config.frame_rate:
+            self.wait(gap)
+    
+    def mark_part(self, part: str):
+        """Record that a narrated part's visuals start now, for captions timed to the video"""
+        self.part_starts[part] = round(self.renderer.time, 3)
+    
+    def clear_scene(self):
+        """Clear active objects to prevent cluttering"""
+        if self.active_mobjects:
+            with self.profiler.measure("clear_scene"):
+                self.play(*[FadeOut(mob) for mob in self.active_mobjects], run_time=CLEAR_FADE_TIME)
+            self.active_mobjects.clear()
+    
+    def capture_thumbnail(self, kind: str, label: str):
+        """Keep a tile of the frame just rendered for the sprite sheet"""
+        if not self.thumbnails_path or self.renderer.skip_animations:
+            return
+        # The last frame written shows the scene one frame before the clock. Farm
+        # segments are timed from their own start and shifted once stitched
+        timestamp = max(0.0, self.renderer.time - 1 / config.frame_rate)
+        tile = thumbnail_tile(self.renderer.camera.pixel_array)
+        self.thumbnails.append(Thumbnail(round(timestamp, 3), kind, label, tile))
+    
+    def add_to_scene(self, mobject):
+        """Add object to scene and track it"""
+        self.active_mobjects.append(mobject)
+        return mobject
+    
+    def render_legacy_steps(self):
+        """Render old-style steps for backward compatibility"""
+        for i, step in enumerate(self.steps):
+            text_content = step.get('text', '')
+            math_content = step.get('math', '')
+            step_duration = step.get('duration', 20)
+            
+            # Clear previous content
+            if i > 0:
+                self.clear_scene()
+            
+            # Show text
+            if text_content:
+                text_obj = Text(text_content, font_size=32, color=WHITE)
+                text_obj.to_edge(UP, buff=1)
+                self.add_to_scene(text_obj)
+                self.play(Write(text_obj), run_time=1.5)
+                self.capture_thumbnail("section", f"Step {i + 1}")
+            
+            # Show math
+            if math_content:
+                try:
+                    math_obj = MathTex(checked_latex(math_content), font_size=44, color=WHITE)
+                    math_obj.move_to(ORIGIN)
+                    self.add_to_scene(math_obj)
+                    self.play(Write(math_obj), run_time=2)
+                    self.capture_thumbnail("equation", math_content)
+                    self.play(Indicate(math_obj, color=BLUE), run_time=1)
+                except Exception as e:
+                    print(f"Math error: {e}")
+                    fallback = Text(f"Math: {math_content}", font_size=28, color=BLUE)
+                    fallback.move_to(ORIGIN)
+                    self.add_to_scene(fallback)
+                    self.play(Write(fallback), run_time=1.5)
+            
+            # Wait for remaining time
+            used_time = 4.5 if text_content and math_content else 3 if text_content or math_content else 1
+            remaining = max(0.5, step_duration - used_time)
+            self.wait(remaining)
+            self.current_time += step_duration
+    
+    def render_section(self, section: Dict[str, Any], section_index: int):
+        """Render section with synchronized visuals and timing - NO CLUTTERING"""
+        
+        section_title = section.get('title', f'Section {section_index + 1}')
+        duration = section.get('duration', 45)
+        visual_sequence = section.get('visualSequence', [])
+        
+        print(f"Rendering section: {section_title} (Duration: {duration}s)")
+        
+        # Narration-synced sections keep the previous visuals up until the fade
+        # out ends right as this section's narration starts
+        self.wait_until(section.get('audioStart'), lead=CLEAR_FADE_TIME if self.active_mobjects else 0)
+        
+        # Clear any previous content at start of section
+        if section_index > 0 or self.current_time > 4:  # Don't clear after title
+            self.clear_scene()
+        
+        section_start_time = 0
+        self.mark_part(f"section-{section_index}")
+        self.pending_section = section_title
+        
+        # Process each visual element with precise timing
+        for i, visual in enumerate(visual_sequence):
+            # Clear previous visual before showing new one to prevent overlap
+            if i > 0:
+                self.clear_scene()
+            
+            self.render_visual_element(visual, section_start_time)
+            
+        # Final wait to complete section duration
+        self.current_time += duration
+    
+    def render_visual_element(self, visual: Dict[str, Any], section_start: float):
+        """Render individual visual element with exact timing - CLEAN DISPLAY"""
+        
+        renderer = get_visual_renderer(visual.get('type', ''))
+        display_duration = visual_display_duration(visual)
+        
+        with self.profiler.measure(renderer.name):
+            self.play_visual_plan(renderer.build(visual.get('content', ''), display_duration, visual))
+    
+    def play_visual_plan(self, plan: VisualPlan):
+        """Track a built visual's mobjects and play its beats in order"""
+        for mobject in plan.mobjects:
+            self.add_to_scene(mobject)
+        
+        for i, (animations, run_time) in enumerate(plan.beats):
+            if animations:
+                self.play(*animations, run_time=run_time)
+                if self.pending_section is not None:
+                    self.capture_thumbnail("section", self.pending_section)
+                    self.pending_section = None
+                if i in plan.captures:
+                    self.capture_thumbnail("equation", plan.captures[i])
+            elif run_time > 0:
+                self.wait(run_time)
+    
+    def render_introduction(self):
+        """Render introduction section"""
+        intro = self.introduction
+        intro_text = intro.get('text', '')
+        duration = intro.get('duration', 30)
+        self.mark_part("introduction")
+        
+        if intro_text:
+            # Create centered introduction text, wrapped to fit the frame
+            intro_obj = fitted_text(intro_text, font_size=36, color=WHITE)
+            intro_obj.move_to(ORIGIN)
+            self.add_to_scene(intro_obj)
+            
+            self.play(Write(intro_obj), run_time=2)
+            self.capture_thumbnail("section", "Introduction")
+            self.wait(max(1, duration - 4))  # Account for write and fade time
+            
+        self.current_time += duration
+    
+    def render_conclusion(self):
+        """Render conclusion section"""
+        # Clear previous content
+        self.clear_scene()
+        
+        conclusion = self.conclusion
+        conclusion_text = conclusion.get('text', '')
+        duration = conclusion.get('duration', 20)
+        self.mark_part("conclusion")
+        
+        if conclusion_text:
+            with self.profiler.measure("conclusion"):
+                conclusion_obj = fitted_text(conclusion_text, font_size=32, color=BLUE, weight=BOLD)
+                conclusion_obj.move_to(ORIGIN)
+                self.add_to_scene(conclusion_obj)
+                
+                self.play(Write(conclusion_obj), run_time=2)
+                self.capture_thumbnail("section", "Conclusion")
+                self.wait(max(1, duration - 2))
+            
+        self.current_time += duration
+    
+    def clean_latex(self, latex_str: str) -> str:
+        """Clean LaTeX string for Manim compatibility"""
+        return clean_latex(latex_str)